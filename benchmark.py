@@ -0,0 +1,214 @@
+from customer import Customer, PAST_DATE, ROW_COLUMNS
+from loan import LOAN_COLUMNS, LoanBook, generate_loans
+from rows import RowBuffer
+from shards import seed_all
+from simulation import VectorizedSimulation, simulate_day
+from writers import CsvChunkWriter
+from datetime import timedelta
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+DEFAULT_SIZES = [100, 1000, 10_000]
+DEFAULT_DAYS = 30
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_SEED = 42
+DEFAULT_REPEAT = 3
+"""Stages of the generation, every one is timed separately"""
+STAGES = ['customers', 'customer_batch', 'loans', 'daily_loop', 'vectorized_loop', 'rows', 'serialization']
+
+
+def prepare(stage: str, num_clients: int, days: int, directory: str) -> tuple:
+    """
+    Create the input of a stage, the time spent here is not measured.
+
+    :param stage: one of STAGES
+    :param num_clients: number of clients
+    :param days: number of simulated days
+    :param directory: directory for the files written by the stage
+    :return: tuple: (function that runs the stage, number of rows it produces)
+    """
+    if stage == 'customers':
+        return lambda: [Customer() for _ in range(num_clients)], num_clients
+
+    if stage == 'customer_batch':
+        return lambda: Customer.generate_batch(num_clients), num_clients
+
+    population = Customer.generate_batch(num_clients)
+    customers = population.to_customers()
+    if stage == 'loans':
+        return lambda: [generate_loans(customer) for customer in customers], num_clients
+
+    end_date = PAST_DATE + timedelta(days=days - 1)
+    if stage == 'daily_loop':
+        loans = [generate_loans(customer) for customer in customers]
+
+        def daily_loop():
+            with CsvChunkWriter(os.devnull, LOAN_COLUMNS) as loans_table:
+                for customer, customer_loans in zip(customers, loans):
+                    day = PAST_DATE
+                    while day <= end_date:
+                        simulate_day(customer, customer_loans, day, loans_table)
+                        day += timedelta(days=1)
+        return daily_loop, num_clients * days
+
+    if stage == 'vectorized_loop':
+        simulation = VectorizedSimulation(population, LoanBook.issue(population))
+
+        def vectorized_loop():
+            # Only the simulation of the days, like daily_loop: rows are timed by the rows and serialization stages
+            with CsvChunkWriter(os.devnull, LOAN_COLUMNS) as loans_table:
+                simulation.loans_table = loans_table
+                day = PAST_DATE
+                while day <= end_date:
+                    simulation.step(day)
+                    day += timedelta(days=1)
+        return vectorized_loop, num_clients * days
+
+    if stage == 'rows':
+        def rows():
+            buffer = RowBuffer(ROW_COLUMNS, num_clients * days)
+            for customer in customers:
+                for _ in range(days):
+                    buffer.append(customer.create_ds_values())
+            return buffer
+        return rows, num_clients * days
+
+    if stage == 'serialization':
+        buffer = RowBuffer(ROW_COLUMNS, num_clients * days)
+        for customer in customers:
+            for _ in range(days):
+                buffer.append(customer.create_ds_values())
+        path = os.path.join(directory, 'per_client_per_day.csv')
+        return lambda: buffer.to_frame().to_csv(path, index=False), num_clients * days
+
+    raise ValueError(f"stage must be one of {STAGES}")
+
+
+def measure(stage: str, num_clients: int, days: int, seed: int, directory: str, repeat: int = DEFAULT_REPEAT) -> dict:
+    """
+    Run a stage with the same seed repeat times to measure the wall time, the fastest run is kept,
+    and once more under tracemalloc to measure the peak memory, as tracemalloc slows down the code it traces.
+
+    :param stage: one of STAGES
+    :param num_clients: number of clients
+    :param days: number of simulated days
+    :param seed: seed of the random generators
+    :param directory: directory for the files written by the stage
+    :param repeat: number of timed runs
+    :return: dict with wall time in seconds, rows per second and peak memory in bytes
+    """
+    wall_time = float('inf')
+    for _ in range(repeat):
+        seed_all(seed)
+        run, rows = prepare(stage, num_clients, days, directory)
+        start = time.perf_counter()
+        run()
+        wall_time = min(wall_time, time.perf_counter() - start)
+
+    seed_all(seed)
+    run, _ = prepare(stage, num_clients, days, directory)
+    tracemalloc.start()
+    run()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'wall_time': wall_time,
+        'rows': rows,
+        'rows_per_second': rows / wall_time if wall_time > 0 else float('inf'),
+        'peak_memory': peak_memory
+    }
+
+
+def run_benchmarks(stages: list, sizes: list, days: int, seed: int, repeat: int = DEFAULT_REPEAT) -> dict:
+    """
+    :param stages: names of the stages to run
+    :param sizes: numbers of clients every stage is run with
+    :param days: number of simulated days
+    :param seed: seed of the random generators
+    :param repeat: number of timed runs of every stage and size
+    :return: dict with the environment, the arguments and the results of every stage for every size
+    """
+    results = {stage: {} for stage in stages}
+    with tempfile.TemporaryDirectory(prefix='benchmark-') as directory:
+        for stage in stages:
+            for num_clients in sizes:
+                results[stage][str(num_clients)] = measure(stage, num_clients, days, seed, directory, repeat)
+                print_result(stage, num_clients, results[stage][str(num_clients)])
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'days': days,
+        'seed': seed,
+        'repeat': repeat,
+        'results': results
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Compare the wall time of every stage and size with the baseline.
+
+    :param results: result of run_benchmarks
+    :param baseline: result of run_benchmarks saved earlier
+    :param threshold: allowed slowdown, e.g. 0.2 means 20% slower than the baseline
+    :return: list of messages about the stages that are slower than the baseline by more than the threshold
+    """
+    regressions = []
+    if results['days'] != baseline['days']:
+        print(f"Warning: the baseline simulates {baseline['days']} days, not {results['days']}")
+    for stage, sizes in results['results'].items():
+        for size, result in sizes.items():
+            baseline_result = baseline['results'].get(stage, {}).get(size)
+            if baseline_result is None:
+                continue
+            ratio = result['wall_time'] / baseline_result['wall_time']
+            if ratio > 1 + threshold:
+                regressions.append(f"{stage} with {size} clients: {result['wall_time']:.3f}s, "
+                                   f"{ratio:.2f}x the baseline {baseline_result['wall_time']:.3f}s")
+    return regressions
+
+
+def print_result(stage: str, num_clients: int, result: dict):
+    print(f"{stage:>16} {num_clients:>8} clients: {result['wall_time']:9.3f}s "
+          f"{result['rows_per_second']:12,.0f} rows/s {result['peak_memory'] / 2 ** 20:9.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time every stage of the dataset generation.')
+    parser.add_argument('-n', "--sizes", type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Numbers of clients every stage is run with.')
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS,
+                        help='Number of simulated days in the daily loop, row and serialization stages.')
+    parser.add_argument("--stages", nargs='+', choices=STAGES, default=STAGES, help='Stages to run.')
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help='Seed of the random generators.')
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help='Number of timed runs of every stage, the fastest one is kept.')
+    parser.add_argument("--output", default='benchmark.json', help='JSON file for the results.')
+    parser.add_argument("--baseline", default=None, help='JSON file with results to compare with.')
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed slowdown compared to the baseline, 0.2 means 20%%.')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.stages, args.sizes, args.days, args.seed, args.repeat)
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Slower than the baseline by more than {args.threshold:.0%}:", *regressions, sep='\n  ')
+            sys.exit(1)
+        print("No regressions compared to the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from datetime import date
 from dateutil.relativedelta import relativedelta
-from faker import Faker
+from ledger import DebtLedger
+from pools import get_pools
 import random
 import numpy as np
+import pandas as pd
 import uuid
 
 GENDERS = ['male', 'female']
@@ -12,22 +14,45 @@ EDUCATION_LEVELS = ['HS-grad', 'Some-college', 'Bachelors', 'Masters', 'Doctorat
 MARITAL_STATUSES = ['married', 'single', 'divorced', 'widowed']
 PAST_DATE = date.today() - relativedelta(years=2)
 RESIDENTIAL_STATUS = ['owns', 'rent']
+MINIMUM_WAGE = 6000
+"""Columns of Customer.create_ds_row, in the order of Customer.create_ds_values"""
+ROW_COLUMNS = ['timestamp', 'customer_id', 'age', 'gender', 'geography', 'marital_status', 'education_level',
+               'employment_status', 'occupation', 'citizenship', 'residential_status', 'parental_status',
+               'current_balance', 'total_current_debt', 'credit_score', 'total_loans_amount', 'loans_repayment',
+               'savings', 'investment', 'month_income', 'monthly_expenses', 'payment_history', 'calls_to_branch',
+               'visits_to_branch', 'mobile_entrances', 'online_entrances', 'atm_withdrawals', 'atm_deposits',
+               'calls_to_support', 'adds_use', 'time_spent', 'customer_feedback']
+"""Columns of Customer.create_ds_row that never change during the simulation, written once per customer"""
+CUSTOMER_COLUMNS = ['customer_id', 'date_of_birth', 'gender', 'geography', 'marital_status', 'education_level',
+                    'employment_status', 'occupation', 'citizenship', 'residential_status', 'parental_status',
+                    'month_income', 'calls_to_branch', 'visits_to_branch', 'mobile_entrances', 'online_entrances',
+                    'atm_withdrawals', 'atm_deposits', 'calls_to_support', 'adds_use', 'time_spent',
+                    'customer_feedback']
+"""Columns of Customer.create_ds_row that change from day to day"""
+DAILY_COLUMNS = ['timestamp', 'customer_id', 'age', 'current_balance', 'total_current_debt', 'credit_score',
+                 'total_loans_amount', 'loans_repayment', 'savings', 'investment', 'monthly_expenses',
+                 'payment_history']
+"""Daily columns that describe the state of a customer, a new row is needed only if one of them changes"""
+STATE_COLUMNS = DAILY_COLUMNS[2:]
+"""Columns with amounts of money, rounded to cents in the output"""
+MONEY_COLUMNS = ['current_balance', 'total_current_debt', 'loans_repayment', 'savings', 'investment',
+                 'monthly_expenses']
 
 
 class Customer:
     """A class to represent a bank customer."""
     def __init__(self):
         self.timestamp = PAST_DATE
-        self.customer_id = str(uuid.uuid4())
+        self.customer_id = generate_customer_id()
 
         self.date_of_birth = self.generate_date_of_birth()
         self.age = self.calculate_age(PAST_DATE)
         self.gender = np.random.choice(GENDERS, p=[0.51, 0.49])
-        self.geography = Faker().address()
+        self.geography = get_pools().addresses(1)[0]
         self.marital_status = np.random.choice(MARITAL_STATUSES, p=[0.48, 0.36, 0.09, 0.07])
         self.education_level = self.generate_education_level()
         self.employment_status = np.random.choice(EMPLOYMENT_STATUSES, p=[0.65, 0.25, 0.1])
-        self.occupation = Faker().job()
+        self.occupation = get_pools().jobs(1)[0]
         self.citizenship = np.random.choice([True, False], p=[0.95, 0.05])
         self.residential_status = np.random.choice(RESIDENTIAL_STATUS, p=[0.65, 0.35])
         self.parental_status = np.random.choice([True, False], p=[0.69, 0.31])
@@ -35,15 +60,13 @@ class Customer:
         self.credit_score = self.generate_credit_score()
         self.month_income = random.randint(6000, 25000)
         self.current_balance = self.generate_current_balance()
-        self.total_current_debt = []
-        self.total_loans_amount = []
+        self.debt_ledger = DebtLedger()
         self.loans_repayment = 0
         self.savings = self.money_amount_with_prob(2000, 4000, [0.7, 0.3])
         self.investment = self.money_amount_with_prob(5000, 10000, [0.3, 0.7])
         self.monthly_expenses = 0
         self.payment_history = 0
         self.num_current_loans = 0
-        self.loans_month_payment = []
         self.borrowing_capacity = 0
 
         self.atm_withdrawals = self.generate_atm_withdrawals()
@@ -58,6 +81,99 @@ class Customer:
         self.time_spent = self.generate_time_spent()
         self.customer_feedback = random.randint(0, 5)
 
+    @classmethod
+    def generate_batch(cls, num_customers: int) -> 'Population':
+        """
+        Generate the attributes of many customers at once. Every categorical and numeric attribute is drawn for all
+        customers in one vectorized call with the same distributions as in __init__, addresses, jobs and dates of birth
+        are sampled from the cached pools.
+
+        :param num_customers: number of customers to generate
+        :return: Population: array-backed population of customers
+        """
+        n = num_customers
+        customer_id = np.array([generate_customer_id() for _ in range(n)], dtype=object)
+
+        pools = get_pools()
+        date_of_birth = pools.birth_dates(n)
+        birth_year, birth_month, birth_day = split_dates(date_of_birth)
+        age = PAST_DATE.year - birth_year - (
+                (PAST_DATE.month < birth_month) | ((PAST_DATE.month == birth_month) & (PAST_DATE.day < birth_day)))
+
+        # Education level is chosen uniformly among the levels that are possible at the given age
+        num_levels = np.select([age < 19, age < 22, age < 26], [1, 2, 3], default=len(EDUCATION_LEVELS))
+        education_level = np.array(EDUCATION_LEVELS, dtype=object)[(np.random.random(n) * num_levels).astype(int)]
+
+        month_income = np.random.randint(6000, 25001, n)
+        balance_on_creation = np.random.randint(100, 3001, n)
+        if PAST_DATE.day == 1:
+            balance_on_creation += month_income
+        atm_withdrawals = money_amount_with_prob_batch(50, 300, [0.2, 0.8], n)
+        atm_withdrawals[atm_withdrawals > balance_on_creation] = 0
+        balance_on_creation -= atm_withdrawals
+        atm_deposits = money_amount_with_prob_batch(50, 300, [0.2, 0.8], n)
+        atm_deposits[atm_deposits > balance_on_creation] = 0
+        # Like in __init__, the balance is generated again after ATM operations
+        current_balance = np.random.randint(100, 3001, n)
+        if PAST_DATE.day == 1:
+            current_balance += month_income
+
+        mobile_entrances = np.random.choice(np.arange(0, 5), n)
+        online_entrances = np.random.choice(np.arange(0, 1), n)
+        time_spent = np.where((mobile_entrances != 0) | (online_entrances != 0),
+                              np.random.randint(2, 11, n), None).astype(object)
+
+        return Population(
+            customer_id=customer_id,
+            date_of_birth=date_of_birth,
+            age=age,
+            gender=np.random.choice(GENDERS, n, p=[0.51, 0.49]).astype(object),
+            geography=pools.addresses(n),
+            marital_status=np.random.choice(MARITAL_STATUSES, n, p=[0.48, 0.36, 0.09, 0.07]).astype(object),
+            education_level=education_level,
+            employment_status=np.random.choice(EMPLOYMENT_STATUSES, n, p=[0.65, 0.25, 0.1]).astype(object),
+            occupation=pools.jobs(n),
+            citizenship=np.random.random(n) < 0.95,
+            residential_status=np.random.choice(RESIDENTIAL_STATUS, n, p=[0.65, 0.35]).astype(object),
+            parental_status=np.random.random(n) < 0.69,
+
+            credit_score=np.random.randint(580, 801, n),
+            month_income=month_income,
+            current_balance=current_balance,
+            savings=money_amount_with_prob_batch(2000, 4000, [0.7, 0.3], n),
+            investment=money_amount_with_prob_batch(5000, 10000, [0.3, 0.7], n),
+
+            atm_withdrawals=atm_withdrawals,
+            atm_deposits=atm_deposits,
+            calls_to_branch=np.random.choice([0, 1, 2], n, p=[0.85, 0.1, 0.05]),
+            visits_to_branch=np.random.choice([0, 1], n, p=[0.85, 0.15]),
+            mobile_entrances=mobile_entrances,
+            online_entrances=online_entrances,
+            calls_to_support=np.random.choice([0, 1], n, p=[0.85, 0.15]),
+            adds_use=np.random.choice([0, 1], n, p=[0.95, 0.05]),
+            time_spent=time_spent,
+            customer_feedback=np.random.randint(0, 6, n)
+        )
+
+    @classmethod
+    def from_attributes(cls, attributes: dict) -> 'Customer':
+        """
+        Create a customer with the given attributes instead of random ones, the transaction state starts empty.
+
+        :param attributes: dict with the attributes generated in __init__, e.g. a row of a Population
+        :return: Customer
+        """
+        customer = cls.__new__(cls)
+        customer.__dict__.update(attributes)
+        customer.timestamp = PAST_DATE
+        customer.debt_ledger = DebtLedger()
+        customer.loans_repayment = 0
+        customer.monthly_expenses = 0
+        customer.payment_history = 0
+        customer.num_current_loans = 0
+        customer.borrowing_capacity = 0
+        return customer
+
     def money_amount_with_prob(self, min_num: int, max_num: int, prob_list: list) -> int:
         """
         Generate a random amount of money with a specified probability of being zero.
@@ -91,7 +207,7 @@ class Customer:
 
         :return: A string representing the birthdate.
         """
-        return Faker().date_of_birth(minimum_age=20, maximum_age=67)
+        return get_pools().birth_dates(1)[0].item()
 
     def calculate_age(self, timestamp):
         """
@@ -176,44 +292,167 @@ class Customer:
         if self.mobile_entrances != 0 or self.online_entrances != 0:
             return random.randint(2, 10)
 
-    def create_ds_row(self):
+    def create_ds_values(self) -> tuple:
+        """
+        Creates a tuple with the values of a row in the dataset, in the order of ROW_COLUMNS.
+        Amounts of money are not rounded here, they are rounded for a whole chunk of rows when it is written.
+
+        :return: tuple: customer attributes and transaction data
+        """
+        return (
+            self.timestamp,
+            self.customer_id,
+
+            self.age,
+            self.gender,
+            self.geography,
+            self.marital_status,
+            self.education_level,
+            self.employment_status,
+            self.occupation,
+            self.citizenship,
+            self.residential_status,
+            self.parental_status,
+
+            self.current_balance,
+            self.debt_ledger.total_debt,
+            self.credit_score,
+            self.debt_ledger.total_loans_amount,
+            self.loans_repayment,
+            self.savings,
+            self.investment,
+            self.month_income,
+            self.monthly_expenses * self.month_income,
+            self.payment_history,
+
+            self.calls_to_branch,
+            self.visits_to_branch,
+            self.mobile_entrances,
+            self.online_entrances,
+            self.atm_withdrawals,
+            self.atm_deposits,
+            self.calls_to_support,
+            self.adds_use,
+            self.time_spent,
+            self.customer_feedback
+        )
+
+    def create_ds_row(self) -> dict:
         """
         Creates a dictionary representing a row in the dataset, with customer attributes and transaction data.
+        The values are the same as in the per_client_per_day table, with amounts of money rounded to cents.
+        """
+        return create_row(ROW_COLUMNS, self.create_ds_values())
+
+
+class Population:
+    """
+    A batch of customers stored column by column: every attribute generated in Customer.__init__
+    is a NumPy array with one value per customer.
+    """
+    FIELDS = ['customer_id', 'date_of_birth', 'age', 'gender', 'geography', 'marital_status', 'education_level',
+              'employment_status', 'occupation', 'citizenship', 'residential_status', 'parental_status',
+              'credit_score', 'month_income', 'current_balance', 'savings', 'investment',
+              'atm_withdrawals', 'atm_deposits', 'calls_to_branch', 'visits_to_branch', 'mobile_entrances',
+              'online_entrances', 'calls_to_support', 'adds_use', 'time_spent', 'customer_feedback']
+
+    def __init__(self, **columns):
+        missing = set(self.FIELDS) - set(columns)
+        if missing:
+            raise ValueError(f"Population is missing columns: {sorted(missing)}")
+        self.columns = columns
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self):
+        return len(self.columns['customer_id'])
+
+    def customer(self, index: int) -> Customer:
+        """
+        Create a Customer object for one customer of the population.
+
+        :param index: position of the customer in the population
+        :return: Customer
+        """
+        # NumPy scalars become Python values, arithmetic on them is much faster and dates become datetime.date
+        attributes = {field: values[index].item() if values.dtype != object else values[index]
+                      for field, values in self.columns.items()}
+        return Customer.from_attributes(attributes)
+
+    def create_ds_frame(self) -> pd.DataFrame:
+        """
+        Creates a DataFrame with one row per customer and the columns that never change during the simulation.
+
+        :return: pd.DataFrame: rows of the customers dataset
+        """
+        return pd.DataFrame({column: self.columns[column] for column in CUSTOMER_COLUMNS})
+
+    def to_customers(self) -> list:
         """
-        return {
-            'timestamp': self.timestamp,
-            'customer_id': self.customer_id,
-
-            'age': self.age,
-            'gender': self.gender,
-            'geography': self.geography,
-            'marital_status': self.marital_status,
-            'education_level': self.education_level,
-            'employment_status': self.employment_status,
-            'occupation': self.occupation,
-            'citizenship': self.citizenship,
-            'residential_status': self.residential_status,
-            'parental_status': self.parental_status,
-
-            'current_balance': round(self.current_balance, 2),
-            'total_current_debt': round(sum(self.total_current_debt), 2),
-            'credit_score': self.credit_score,
-            'total_loans_amount': round(sum(self.total_loans_amount), 2),
-            'loans_repayment': round(self.loans_repayment, 2),
-            'savings': round(self.savings, 2),
-            'investment': round(self.investment, 2),
-            'month_income': round(self.month_income, 2),
-            'monthly_expenses': round(self.monthly_expenses * self.month_income, 2),
-            'payment_history': self.payment_history,
-
-            'calls_to_branch': self.calls_to_branch,
-            'visits_to_branch': self.visits_to_branch,
-            'mobile_entrances': self.mobile_entrances,
-            'online_entrances': self.online_entrances,
-            'atm_withdrawals': self.atm_withdrawals,
-            'atm_deposits': self.atm_deposits,
-            'calls_to_support': self.calls_to_support,
-            'adds_use': self.adds_use,
-            'time_spent': self.time_spent,
-            'customer_feedback': self.customer_feedback
-        }
+        :return: list of Customer objects, one per customer of the population
+        """
+        return [self.customer(i) for i in range(len(self))]
+
+
+def create_row(columns: list, values: tuple) -> dict:
+    """
+    Build a row of the dataset as a dict of Python values, e.g. from Customer.create_ds_values. Amounts of money
+    are rounded with np.round like RowBuffer.to_frame rounds them, so the row matches the written tables.
+
+    :param columns: names of the columns, in the order of the values
+    :param values: values of the row
+    :return: dict: column -> value
+    """
+    row = {}
+    for column, value in zip(columns, values):
+        if isinstance(value, np.generic):
+            value = value.item()
+        if column in MONEY_COLUMNS:
+            value = float(np.round(value, 2))
+        row[column] = value
+    return row
+
+
+def generate_customer_id() -> str:
+    """
+    Generate a random version 4 UUID from the random module, unlike uuid.uuid4() it is reproducible with random.seed().
+
+    :return: str: customer id
+    """
+    return str(uuid.UUID(int=random.getrandbits(128), version=4))
+
+
+def money_amount_with_prob_batch(min_num: int, max_num: int, prob_list: list, size: int) -> np.ndarray:
+    """
+    Vectorized version of Customer.money_amount_with_prob: generate an array of random amounts of money,
+    every amount is a number in the range [min_num, max_num] with probability prob_list[0] and zero otherwise.
+
+    :param min_num: The minimum amount of money that can be generated.
+    :param max_num: The maximum amount of money that can be generated.
+    :param prob_list: A list of two probabilities that must sum to 1.
+    :param size: number of amounts to generate
+    :return: np.ndarray: generated amounts of money
+    """
+    if sum(prob_list) != 1:
+        raise ValueError("Probabilities in prob_list must sum to 1")
+    amounts = np.random.randint(min_num, max_num + 1, size)
+    amounts[np.random.random(size) >= prob_list[0]] = 0
+    return amounts
+
+
+def split_dates(dates: np.ndarray) -> tuple:
+    """
+    Split an array of datetime64[D] dates into years, months and days.
+
+    :param dates: np.ndarray of datetime64[D]
+    :return: tuple of three int arrays: years, months (1-12) and days (1-31)
+    """
+    years = dates.astype('datetime64[Y]')
+    months = dates.astype('datetime64[M]')
+    return (years.astype(int) + 1970,
+            (months - years).astype(int) + 1,
+            (dates - months).astype(int) + 1)
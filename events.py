@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+import heapq
+
+ONE_DAY = timedelta(days=1)
+"""Days of month when simulation.simulate_day changes the state of a client, on other days it only resets daily values"""
+CALENDAR_DAYS = (1, 10, 15, 17, 19, 25, 30)
+
+
+def calendar_events(start_date: date, end_date: date) -> list:
+    """
+    Find all dates between start_date and end_date (both included) that fall on one of CALENDAR_DAYS.
+    The calendar is the same for all clients, so it is built once per run.
+
+    :param start_date: the first simulated date
+    :param end_date: the last simulated date
+    :return: list of sorted dates
+    """
+    events = []
+    month = date(start_date.year, start_date.month, 1)
+    while month <= end_date:
+        for day in CALENDAR_DAYS:
+            try:
+                event = month.replace(day=day)
+            except ValueError:
+                # e.g. there is no 30th of February
+                continue
+            if start_date <= event <= end_date:
+                events.append(event)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return events
+
+
+def build_event_queue(calendar: list, loans: list, start_date: date, end_date: date) -> list:
+    """
+    Build the queue of days when the state of a client can change: the calendar days and the dates of client's loans.
+
+    :param calendar: sorted dates returned by calendar_events
+    :param loans: candidate loans of the client
+    :param start_date: the first simulated date
+    :param end_date: the last simulated date
+    :return: list of sorted unique dates
+    """
+    loan_dates = sorted(loan.date for loan in loans if start_date <= loan.date <= end_date)
+    queue = []
+    for event in heapq.merge(calendar, loan_dates):
+        if not queue or queue[-1] != event:
+            queue.append(event)
+    return queue
@@ -0,0 +1,95 @@
+import numpy as np
+
+"""generate_loans creates at most 6 loans per customer, so the ledger of a customer rarely has to grow"""
+DEFAULT_CAPACITY = 6
+
+
+class DebtLedger:
+    """
+    A class that keeps the loans of one customer in fixed slots of NumPy arrays.
+
+    A slot holds the remaining debt, the size and the month payment of one loan, and a mask marks the active slots.
+    Totals of all active loans are updated when a loan is added, paid or closed, so reading them does not depend
+    on the number of loans, and closing a loan only frees its slot without moving the other loans.
+    """
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        :param capacity: number of slots allocated at the start, the ledger doubles it when all slots are taken
+        """
+        if capacity < 1:
+            raise ValueError("capacity must be a positive number")
+        self.debt = np.zeros(capacity, dtype=np.float64)
+        self.loan_size = np.zeros(capacity, dtype=np.float64)
+        self.month_payment = np.zeros(capacity, dtype=np.float64)
+        self.active = np.zeros(capacity, dtype=bool)
+
+        self.total_debt = 0.0
+        self.total_loans_amount = 0.0
+        self.total_month_payment = 0.0
+        self.num_loans = 0
+
+    def add(self, debt: float, loan_size: float, month_payment: float) -> int:
+        """
+        Put a new loan into the first free slot.
+
+        :param debt: full debt of the loan, the loan size with interest
+        :param loan_size: size of the loan
+        :param month_payment: month payment of the loan
+        :return: int: slot of the loan
+        """
+        if self.num_loans == len(self.active):
+            self._grow()
+        slot = int(np.argmin(self.active))
+        self.debt[slot] = debt
+        self.loan_size[slot] = loan_size
+        self.month_payment[slot] = month_payment
+        self.active[slot] = True
+
+        self.total_debt += float(debt)
+        self.total_loans_amount += float(loan_size)
+        self.total_month_payment += float(month_payment)
+        self.num_loans += 1
+        return slot
+
+    def pay(self, slot: int, amount: float):
+        """
+        Decrease the remaining debt of a loan.
+
+        :param slot: slot of the loan
+        :param amount: paid amount
+        """
+        self.debt[slot] -= amount
+        self.total_debt -= float(amount)
+
+    def close(self, slot: int):
+        """
+        Remove a loan from the ledger, the other loans keep their slots.
+
+        :param slot: slot of the loan
+        """
+        self.active[slot] = False
+        self.num_loans -= 1
+        if self.num_loans == 0:
+            # Start from exact zeros, so that rounding errors of the running totals do not pile up
+            self.total_debt = self.total_loans_amount = self.total_month_payment = 0.0
+            return
+        self.total_debt -= float(self.debt[slot])
+        self.total_loans_amount -= float(self.loan_size[slot])
+        self.total_month_payment -= float(self.month_payment[slot])
+
+    def slots(self) -> list:
+        """
+        :return: list of the slots of the active loans, in the order of the slots
+        """
+        return np.flatnonzero(self.active).tolist()
+
+    def __len__(self):
+        return self.num_loans
+
+    def _grow(self):
+        capacity = 2 * len(self.active)
+        for name in ['debt', 'loan_size', 'month_payment', 'active']:
+            values = getattr(self, name)
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:len(values)] = values
+            setattr(self, name, grown)
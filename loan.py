@@ -1,14 +1,33 @@
 from datetime import date
-from customer import Customer
+from customer import Customer, Population, MINIMUM_WAGE, create_row
 import random
 import numpy as np
 from dateutil.relativedelta import relativedelta
+import pandas as pd
 import uuid
 
 PAST_DATE = date.today() - relativedelta(years=2)
 PURPOSES = ['car', 'education', 'vacation', 'business', 'other']
 DEPT_TO_INCOME_RATIO = 0.6
 MONTH_IN_YEAR = 12
+INTEREST_RATE = 0.0499
+CREDIT_SCORE_THRESHOLD = 670
+MAX_DEBT_TO_INCOME_RATIO = 0.4
+"""Columns of Loan.create_ds_row, in the order of Loan.create_ds_values"""
+LOAN_COLUMNS = ['loan_id', 'customer_id', 'date', 'loan_size', 'loan_type']
+"""Possible sizes of every type of loan, computed once instead of on every generated loan"""
+LOAN_SIZES = {
+    'car': np.arange(50_000, 710_000, 10_000),
+    'education': np.arange(20_000, 200_000, 5_000),
+    'vacation': np.arange(5_000, 20_000, 1_000),
+    'business': np.arange(50_000, 200_000, 5_000),
+    'other': np.arange(5_000, 100_000, 1_000)
+}
+"""LOAN_SIZES as one zero-padded table with a row per type in PURPOSES, for vectorized sampling"""
+LOAN_SIZE_COUNTS = np.array([len(LOAN_SIZES[purpose]) for purpose in PURPOSES])
+LOAN_SIZE_GRID = np.zeros((len(PURPOSES), LOAN_SIZE_COUNTS.max()), dtype=np.int64)
+for _i, _purpose in enumerate(PURPOSES):
+    LOAN_SIZE_GRID[_i, :LOAN_SIZE_COUNTS[_i]] = LOAN_SIZES[_purpose]
 
 
 class Loan:
@@ -23,7 +42,7 @@ class Loan:
         self.loan_id = str(uuid.uuid3(uuid.NAMESPACE_X500, self.customer_id + str(self.date)))
         self.loan_type = random.choice(PURPOSES)
         self.loan_length = 3
-        self.interest_rate = 0.0499
+        self.interest_rate = INTEREST_RATE
         self.generate_loan_size()
         self.loan_size = self.generate_loan_size()
         self.full_dept = 0
@@ -36,17 +55,9 @@ class Loan:
         This function generates a random loan size based on the loan type.
         :return: int: A random loan size based on the loan type.
         """
+        loan_size = random.choice(LOAN_SIZES[self.loan_type])
         if self.loan_type == 'car':
-            loan_size = random.choice(np.arange(50_000, 710_000, 10_000))
             self.loan_length = 5
-        elif self.loan_type == 'education':
-            loan_size = random.choice(np.arange(20_000, 200_000, 5_000))
-        elif self.loan_type == 'vacation':
-            loan_size = random.choice(np.arange(5_000, 20_000, 1_000))
-        elif self.loan_type == 'business':
-            loan_size = random.choice(np.arange(50_000, 200_000, 5_000))
-        else:
-            loan_size = random.choice(np.arange(5_000, 100_000, 1_000))
 
         if loan_size < 10_000:
             self.loan_length = 1
@@ -91,7 +102,7 @@ class Loan:
         max_monthly_loan_payment = self.customer.month_income * 0.3
 
         # Subtract any other monthly debt payments from the maximum monthly debt payment
-        net_monthly_debt_payment = max_monthly_debt_payment - sum(self.customer.total_current_debt)
+        net_monthly_debt_payment = max_monthly_debt_payment - self.customer.debt_ledger.total_debt
 
         # Calculate the monthly interest rate and number of payments
         monthly_interest_rate = self.interest_rate / MONTH_IN_YEAR
@@ -117,7 +128,7 @@ class Loan:
             return False
 
         # Calculate the client's debt-to-income ratio
-        total_current_debt = sum(self.customer.total_current_debt)
+        total_current_debt = self.customer.debt_ledger.total_debt
         debt_ratio = total_current_debt / self.customer.month_income
 
         # Check if the client's debt-to-income ratio is below the threshold
@@ -131,16 +142,206 @@ class Loan:
         # If all conditions are met, the client can take the loan
         return True
 
-    def create_ds_row(self):
+    def create_ds_values(self) -> tuple:
+        """
+        Creates a tuple with the data for a single loan to be added to the data store, in the order of LOAN_COLUMNS.
+
+        :return: tuple: the loan data
+        """
+        return self.loan_id, self.customer_id, self.date, self.loan_size, self.loan_type
+
+    def create_ds_row(self) -> dict:
         """
         Creates a dictionary containing the data for a single loan to be added to the data store.
 
         :return: A dictionary representing the loan data
         """
-        return {
-            'loan_id': self.loan_id,
-            'customer_id': self.customer_id,
-            'date': self.date,
-            'loan_size': self.loan_size,
-            'loan_type': self.loan_type
-        }
+        return create_row(LOAN_COLUMNS, self.create_ds_values())
+
+
+def generate_loans(customer: Customer) -> list:
+    """
+    Generate the candidate loans of a client: from 3 to 6 loans, each with a random date in the simulated period.
+
+    :param customer: the client the loans are generated for
+    :return: list of Loan objects, in the order they are checked on the same day
+    """
+    num_loans = np.random.choice(a=np.arange(3, 7))
+    return [Loan(customer, random.randint(0, 90), random.randint(300, 640)) for _ in range(num_loans)]
+
+
+class LoanPolicy:
+    """
+    The lending policy of the bank: who can take a loan, how much it costs and the minimum monthly expenses.
+    The default policy is the one of the Python and events engines.
+    """
+    FIELDS = ['credit_score_threshold', 'max_debt_to_income_ratio', 'debt_to_income_ratio', 'interest_rate',
+              'minimum_wage']
+
+    def __init__(self, credit_score_threshold: float = CREDIT_SCORE_THRESHOLD,
+                 max_debt_to_income_ratio: float = MAX_DEBT_TO_INCOME_RATIO,
+                 debt_to_income_ratio: float = DEPT_TO_INCOME_RATIO, interest_rate: float = INTEREST_RATE,
+                 minimum_wage: float = MINIMUM_WAGE):
+        """
+        :param credit_score_threshold: the minimum credit score required to be eligible for a loan
+        :param max_debt_to_income_ratio: the maximum ratio of the current debt to the month income to get a loan
+        :param debt_to_income_ratio: share of the month income that can go to debt payments, sets the borrowing capacity
+        :param interest_rate: yearly interest rate of all loans
+        :param minimum_wage: the minimum amount of monthly expenses
+        """
+        self.credit_score_threshold = credit_score_threshold
+        self.max_debt_to_income_ratio = max_debt_to_income_ratio
+        self.debt_to_income_ratio = debt_to_income_ratio
+        self.interest_rate = interest_rate
+        self.minimum_wage = minimum_wage
+
+    def to_dict(self) -> dict:
+        """
+        :return: dict with the parameters of the policy
+        """
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"LoanPolicy({', '.join(f'{name}={value}' for name, value in self.to_dict().items())})"
+
+
+class LoanBook:
+    """
+    Candidate loans of many customers stored column by column: every attribute of Loan is a NumPy array
+    with one value per loan. Loans of one customer are consecutive and keep the order in which they are checked.
+    """
+    def __init__(self, customer_index: np.ndarray, customer_id: np.ndarray, day: np.ndarray, loan_type: np.ndarray,
+                 loan_size: np.ndarray, loan_length: np.ndarray, start_date: date = PAST_DATE,
+                 interest_rate: float = INTEREST_RATE):
+        """
+        :param customer_index: position of the loan's customer in the population
+        :param customer_id: id of the loan's customer
+        :param day: date of the loan as a number of days since start_date
+        :param loan_type: index of the loan type in PURPOSES
+        :param loan_size: size of the loan
+        :param loan_length: length of the loan in years
+        :param start_date: the date day numbers are counted from
+        :param interest_rate: yearly interest rate of all loans
+        """
+        self.customer_index = customer_index
+        self.customer_id = customer_id
+        self.day = day
+        self.loan_type = loan_type
+        self.loan_size = loan_size
+        self.loan_length = loan_length
+        self.start_date = start_date
+        self.interest_rate = interest_rate
+
+        # Same formulas as in Loan.calculate_loan_month_payment
+        self.full_dept = loan_size + loan_size * interest_rate * loan_length
+        self.loan_month_payment = self.full_dept / (loan_length * MONTH_IN_YEAR)
+
+    def __len__(self):
+        return len(self.customer_index)
+
+    @classmethod
+    def issue(cls, population: Population, start_date: date = PAST_DATE) -> 'LoanBook':
+        """
+        Generate the candidate loans of all customers of the population at once,
+        with the same distributions as generate_loans.
+
+        :param population: Population the loans are generated for
+        :param start_date: the first simulated date
+        :return: LoanBook with the loans of all customers
+        """
+        num_loans = np.random.randint(3, 7, len(population))
+        customer_index = np.repeat(np.arange(len(population)), num_loans)
+        n = len(customer_index)
+
+        # Same as Loan.generate_date: a random day in [slice_from_beginning, slice_from_beginning + slice_from_new_date]
+        slice_from_beginning = np.random.randint(0, 91, n)
+        slice_from_new_date = np.random.randint(300, 641, n)
+        day = slice_from_beginning + (np.random.random(n) * (slice_from_new_date + 1)).astype(np.int64)
+
+        loan_type = np.random.randint(0, len(PURPOSES), n)
+        loan_size = cls.sample_loan_sizes(loan_type)
+        loan_length = np.where(loan_type == PURPOSES.index('car'), 5, 3)
+        # Loan.__init__ calls generate_loan_size twice, the size of the first call is dropped,
+        # but it still sets the length to 1 year if it is smaller than 10 000
+        loan_length[(cls.sample_loan_sizes(loan_type) < 10_000) | (loan_size < 10_000)] = 1
+
+        return cls(customer_index, population.customer_id[customer_index], day, loan_type, loan_size, loan_length,
+                   start_date)
+
+    @staticmethod
+    def sample_loan_sizes(loan_type: np.ndarray) -> np.ndarray:
+        """
+        Choose a random size from LOAN_SIZES for every loan.
+
+        :param loan_type: index of the loan type in PURPOSES for every loan
+        :return: np.ndarray: loan sizes
+        """
+        positions = (np.random.random(len(loan_type)) * LOAN_SIZE_COUNTS[loan_type]).astype(np.int64)
+        return LOAN_SIZE_GRID[loan_type, positions]
+
+    def with_interest_rate(self, interest_rate: float) -> 'LoanBook':
+        """
+        :param interest_rate: yearly interest rate of all loans
+        :return: LoanBook with the same loans and another interest rate, it shares all arrays with this book
+                 except the debts and month payments that depend on the rate
+        """
+        return LoanBook(self.customer_index, self.customer_id, self.day, self.loan_type, self.loan_size,
+                        self.loan_length, self.start_date, interest_rate)
+
+    def calculate_borrowing_capacity(self, loans: np.ndarray, month_income: np.ndarray,
+                                     total_current_debt: np.ndarray,
+                                     debt_to_income_ratio: float = DEPT_TO_INCOME_RATIO) -> np.ndarray:
+        """
+        Vectorized Loan.calculate_borrowing_capacity for the given loans.
+
+        :param loans: indices of the loans
+        :param month_income: month income of the customer of every loan
+        :param total_current_debt: current debt of the customer of every loan
+        :param debt_to_income_ratio: share of the month income that can go to debt payments
+        :return: np.ndarray: maximum loan amount that the customer of every loan can borrow
+        """
+        net_monthly_debt_payment = month_income * debt_to_income_ratio - total_current_debt
+        max_monthly_loan_payment = month_income * 0.3
+        monthly_interest_rate = self.interest_rate / MONTH_IN_YEAR
+        num_payments = self.loan_length[loans] * MONTH_IN_YEAR
+        return (net_monthly_debt_payment - max_monthly_loan_payment) * (
+                (1 - (1 + monthly_interest_rate) ** -num_payments) / monthly_interest_rate)
+
+    def can_take_loan(self, loans: np.ndarray, credit_score: np.ndarray, month_income: np.ndarray,
+                      total_current_debt: np.ndarray, borrowing_capacity: np.ndarray,
+                      credit_score_threshold: float, debt_to_income_ratio: float) -> np.ndarray:
+        """
+        Vectorized Loan.can_take_loan for the given loans.
+
+        :param loans: indices of the loans
+        :param credit_score: credit score of the customer of every loan
+        :param month_income: month income of the customer of every loan
+        :param total_current_debt: current debt of the customer of every loan
+        :param borrowing_capacity: borrowing capacity of the customer of every loan
+        :param credit_score_threshold: The minimum credit score required to be eligible for a loan
+        :param debt_to_income_ratio: The maximum debt-to-income ratio allowed to be eligible for a loan
+        :return: np.ndarray: True for every loan the customer is eligible for
+        """
+        return ((credit_score >= credit_score_threshold)
+                & (total_current_debt / month_income < debt_to_income_ratio)
+                & (self.full_dept[loans] <= borrowing_capacity))
+
+    def create_ds_frame(self, loans: np.ndarray) -> pd.DataFrame:
+        """
+        Creates a DataFrame with the rows of the loans dataset for the given loans, with the same columns
+        as Loan.create_ds_row. Loan ids are computed only here, for the loans that are actually issued.
+
+        :param loans: indices of the loans
+        :return: pd.DataFrame: rows of the loans dataset
+        """
+        dates = np.datetime64(self.start_date, 'D') + self.day[loans]
+        customer_id = self.customer_id[loans]
+        loan_id = [str(uuid.uuid3(uuid.NAMESPACE_X500, customer + str(loan_date)))
+                   for customer, loan_date in zip(customer_id, dates)]
+        return pd.DataFrame({
+            'loan_id': loan_id,
+            'customer_id': customer_id,
+            'date': dates,
+            'loan_size': self.loan_size[loans],
+            'loan_type': np.array(PURPOSES, dtype=object)[self.loan_type[loans]]
+        })
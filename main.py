@@ -1,120 +1,136 @@
-import pandas as pd
-import numpy as np
-from customer import Customer
-from loan import Loan
+from shards import generate_sharded, load_run_config, save_run_config, DEFAULT_SHARD_SIZE, DEFAULT_CHECKPOINT_EVERY
+from writers import DEFAULT_CHUNK_ROWS, OUTPUT_MODES, SINKS, TABLES
+from metrics import METRICS
+from stats import STATS
+from sweep import load_scenarios, run_sweep
 from datetime import date
 from dateutil.relativedelta import relativedelta
-from tqdm import tqdm
-import random
+import numpy as np
 import argparse
-
-MINIMUM_WAGE = 6000
+import importlib.util
+import os
+import time
 
 
 def main():
     # Number of clients
     parser = argparse.ArgumentParser()
     parser.add_argument('-n', "--num_clients", default=1000, help='Enter number of clients that you wanna see in dataset.')
+    parser.add_argument("--engine", choices=['python', 'events', 'vectorized', 'indexed'], default='python',
+                        help='Simulate clients one by one in Python, one by one jumping between days with events, '
+                             'all clients at once with NumPy arrays, or one by one in Python with a seed '
+                             'for every client, so that any client can be regenerated alone.')
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES, default='wide',
+                        help='wide: all columns every day; normalized: customers table and daily columns only; '
+                             'delta: like normalized, but daily rows only when the client\'s state changes.')
+    parser.add_argument("--sink", choices=SINKS, default='csv',
+                        help='csv: every table to its own CSV file; sqlite: all tables to one SQLite database; '
+                             'parquet: every table to Parquet files partitioned by month (needs pyarrow).')
+    parser.add_argument("--database", default='dataset.db', help='Path of the SQLite database of the sqlite sink.')
+    parser.add_argument("--dataset-dir", default='dataset',
+                        help='Directory of the parquet sink, with a subdirectory of Parquet files for every table.')
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS,
+                        help='Maximum number of rows kept in memory before they are written to the output files.')
+    parser.add_argument("--workers", type=int, default=1, help='Number of processes that generate clients.')
+    parser.add_argument("--seed", type=int, default=None,
+                        help='Master seed, the same seed gives the same dataset for any number of workers.')
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE,
+                        help='Number of clients generated by a worker at once.')
+    parser.add_argument("--checkpoint-dir", default=None,
+                        help='Directory where the state of the run is saved periodically (vectorized engine only).')
+    parser.add_argument("--checkpoint-every", type=int, default=DEFAULT_CHECKPOINT_EVERY,
+                        help='Number of simulated days between two checkpoints.')
+    parser.add_argument("--resume", action='store_true',
+                        help='Continue the run saved in --checkpoint-dir after a crash.')
+    parser.add_argument("--extend-days", type=int, default=None,
+                        help='Simulate this many days after the end of the run saved in --checkpoint-dir.')
+    parser.add_argument("--scenarios", default=None,
+                        help='JSON file with a list of loan policies, every policy is simulated on the same clients '
+                             'with the vectorized engine and written into its own directory in --sweep-dir.')
+    parser.add_argument("--sweep-dir", default='sweep', help='Directory of the datasets of the --scenarios sweep.')
+    parser.add_argument("--metrics", default='metrics.json',
+                        help='JSON file for the run metrics: time of every phase, counters and peak memory.')
+    parser.add_argument("--stats", default='stats.json',
+                        help='JSON file for the summary statistics of the written rows: quantiles, histograms, '
+                             'counts of values, share of daily rows with a missed payment so far '
+                             'and loan approval rate.')
+    parser.add_argument("--profile", default=None,
+                        help='Directory for cProfile and tracemalloc reports of every phase (only with one worker).')
     args = parser.parse_args()
-    num_clients = int(args.num_clients)
-
-    # Generate N clients
-    customers = [Customer() for _ in tqdm(range(num_clients))]
-
-    # Lists for future datasets
-    per_client_per_day = []
-    loans_table = []
-
-    for customer in tqdm(customers):
-        last_date = customer.timestamp
-        date_of_birth = customer.date_of_birth
-
-        # Generate N loans for client
-        num_loans = np.random.choice(a=np.arange(3, 7))
-        loans = [Loan(customer, random.randint(0, 90), random.randint(300, 640)) for _ in range(num_loans)]
-        while last_date < date.today() - relativedelta(days=1):
-
-            last_date = customer.timestamp
-            # update age on a current date
-            customer.age = last_date.year - date_of_birth.year - (
-                    (last_date.month, last_date.day) < (date_of_birth.month, date_of_birth.day))
-            for loan in loans:
-                if loan.date == last_date:
-                    if loan.can_take_loan(670, 0.4):
-                        customer.num_current_loans += 1
-                        customer.total_current_debt.append(loan.full_dept)
-                        customer.total_loans_amount.append(loan.loan_size)
-                        customer.loans_repayment = 0
-                        customer.loans_month_payment.append(loan.loan_month_payment)
-                        loans_table.append(loan.create_ds_row())
-
-            # Simulate salary day
-            if last_date.day == 1:
-                customer.current_balance += customer.month_income
-
-            # day when all expenses deducted
-            elif last_date.day == 10:
-                if customer.residential_status == 'owns':
-                    customer.monthly_expenses = np.random.choice(np.arange(0.3, 0.5, 0.05))
-                else:
-                    customer.monthly_expenses = np.random.choice(np.arange(0.4, 0.65, 0.05))
-                customer.current_balance -= max(customer.monthly_expenses * customer.current_balance, MINIMUM_WAGE)
-
-            # Simulate loan payment day
-            elif last_date.day == 15:
-                # Check if the client can pay loan on current date
-                for i, loan_month_payment in enumerate(customer.loans_month_payment):
-                    if round(customer.total_current_debt[i], 2) > 0:
-                        if customer.current_balance - loan_month_payment > 0:
-                            customer.loans_repayment += loan_month_payment
-                            customer.total_current_debt[i] -= loan_month_payment
-                            customer.current_balance -= loan_month_payment
-                        else:
-                            customer.payment_history += 1
-                            customer.credit_score -= 10
-                    else:
-                        customer.total_current_debt.pop(i)
-                        customer.loans_month_payment.pop(i)
-                        customer.total_loans_amount.pop(i)
-                        customer.num_current_loans -= 1
-
-            # Add savings
-            elif last_date.day == 17:
-                if customer.savings > 0:
-                    new_savings = random.randint(500, 2000)
-                    if customer.current_balance > new_savings:
-                        customer.savings += new_savings
-                        customer.current_balance -= new_savings
-
-            # Add investments
-            elif last_date.day == 19:
-                if customer.investment > 0:
-                    new_investments = random.randint(500, 4000)
-                    if customer.current_balance > new_investments:
-                        customer.investment += new_investments
-                        customer.current_balance -= new_investments
-
-            elif last_date.day == 25:
-                customer.savings += customer.savings * 0.01
-
-            elif last_date.day == 30:
-                monthly_return = random.uniform(-0.1, 0.1) * customer.investment
-                customer.investment += monthly_return
-
-            else:
-                customer.loans_repayment = 0
-                customer.monthly_expenses = 0
-
-            customer.current_balance = customer.current_balance
-            customer.total_current_debt = customer.total_current_debt
-            customer.timestamp = last_date + relativedelta(days=1)
-            per_client_per_day.append(customer.create_ds_row())
-
-    per_client_per_day_df = pd.DataFrame(per_client_per_day)
-    loans_table_df = pd.DataFrame(loans_table)
 
-    per_client_per_day_df.to_csv('per_client_per_day.csv')
-    loans_table_df.to_csv('loans_table.csv')
+    if args.profile is not None and args.workers > 1:
+        parser.error("--profile works only with --workers 1")
+    if args.sink == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        parser.error("--sink parquet needs pyarrow, install it with pip install pyarrow")
+    if args.sink == 'parquet' and args.checkpoint_dir is not None:
+        parser.error("--checkpoint-dir does not work with --sink parquet")
+    if args.scenarios is not None and args.checkpoint_dir is not None:
+        parser.error("--checkpoint-dir does not work with --scenarios")
+    if args.seed is not None and args.seed < 0:
+        parser.error("--seed must not be negative")
+    for name in ['workers', 'shard_size', 'chunk_rows']:
+        if getattr(args, name) < 1:
+            parser.error(f"--{name.replace('_', '-')} must be at least 1")
+    if args.checkpoint_every < 1:
+        parser.error("--checkpoint-every must be at least 1")
+    if (args.resume or args.extend_days is not None) and args.checkpoint_dir is None:
+        parser.error("--resume and --extend-days require --checkpoint-dir")
+
+    config = {
+        'num_clients': int(args.num_clients),
+        'master_seed': args.seed if args.seed is not None else np.random.SeedSequence().entropy,
+        'engine': args.engine,
+        'output_mode': args.output_mode,
+        'sink': args.sink,
+        'shard_size': args.shard_size,
+        'database': args.database,
+        'chunk_rows': args.chunk_rows,
+        'end_date': date.today() - relativedelta(days=1)
+    }
+    if args.checkpoint_dir is not None:
+        # A resumed or extended run keeps the arguments it was started with
+        saved_config = load_run_config(args.checkpoint_dir)
+        if args.resume or args.extend_days is not None:
+            if saved_config is None:
+                parser.error(f"{args.checkpoint_dir} does not contain a run to continue")
+            config = saved_config
+            if args.extend_days is not None:
+                config['end_date'] += relativedelta(days=args.extend_days)
+        elif saved_config is not None:
+            parser.error(f"{args.checkpoint_dir} already contains a run, pass --resume or --extend-days")
+        elif args.engine != 'vectorized':
+            parser.error("--checkpoint-dir requires --engine vectorized")
+        # If an extension crashes, --resume continues it up to the new end date
+        save_run_config(args.checkpoint_dir, config)
+
+    if args.profile is not None:
+        METRICS.start_profiling(args.profile)
+    start = time.perf_counter()
+    if args.scenarios is not None:
+        try:
+            policies = load_scenarios(args.scenarios)
+        except ValueError as error:
+            parser.error(str(error))
+        config['engine'] = 'vectorized'
+        run_sweep(policies, config['num_clients'], config['master_seed'], config['end_date'], args.sweep_dir,
+                  config['chunk_rows'], config['output_mode'], config['sink'], args.workers)
+        METRICS.add_time('total', time.perf_counter() - start)
+        METRICS.save(args.metrics, config=config, workers=args.workers, scenarios=list(policies))
+        METRICS.save_profiles()
+        return
+    if config['sink'] == 'sqlite':
+        paths = dict.fromkeys(TABLES, config['database'])
+    elif config['sink'] == 'parquet':
+        paths = {name: os.path.join(args.dataset_dir, name) for name in TABLES}
+    else:
+        paths = {name: f'{name}.csv' for name in TABLES}
+    generate_sharded(config['num_clients'], config['master_seed'], config['engine'], config['end_date'], paths,
+                     config['chunk_rows'], config['output_mode'], config['shard_size'], args.workers,
+                     args.checkpoint_dir, args.checkpoint_every, config['sink'])
+    METRICS.add_time('total', time.perf_counter() - start)
+    METRICS.save(args.metrics, config=config, workers=args.workers)
+    STATS.save(args.stats, METRICS.counters, config=config)
+    METRICS.save_profiles()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+from contextlib import contextmanager
+import cProfile
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+import tracemalloc
+
+"""Number of functions and allocation sites listed in the text reports of the profile mode"""
+PROFILE_TOP = 40
+
+
+def peak_memory() -> int:
+    """
+    :return: int: the largest resident set size of this process so far, in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Metrics:
+    """
+    A class that collects the runtime metrics of a run: the time spent in every phase, counters
+    and the peak memory.
+
+    Phases are the large steps of the generation (customers, simulation, write, merge). Timers of smaller steps
+    inside them (loans, simulate_day, create_rows, stats, to_csv, to_sqlite, to_parquet) are added with add_time
+    and are included in the time of the phase around them. In the profile mode every phase also runs under cProfile
+    and allocations are traced with tracemalloc, the reports are written by save_profiles.
+    """
+    def __init__(self):
+        self.timers = {}
+        self.counters = {}
+        self.worker_peak_memory = 0
+        self.profile_dir = None
+        self.profilers = {}
+        self.memory_reports = {}
+
+    def reset(self):
+        """
+        Forget all collected metrics, e.g. in a worker process that reports the metrics of one shard.
+        """
+        self.timers = {}
+        self.counters = {}
+        self.worker_peak_memory = 0
+
+    def add_time(self, name: str, seconds: float):
+        """
+        :param name: name of the timer
+        :param seconds: time to add to the timer
+        """
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def count(self, name: str, value: int = 1):
+        """
+        :param name: name of the counter
+        :param value: number to add to the counter
+        """
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Measure the time spent in the with block, phases must not be nested.
+
+        :param name: name of the phase
+        """
+        profiler = None
+        if self.profile_dir is not None:
+            profiler = self.profilers.setdefault(name, cProfile.Profile())
+            tracemalloc.reset_peak()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+            if profiler is not None:
+                profiler.disable()
+                self._trace_memory(name)
+
+    def _trace_memory(self, name: str):
+        # A phase runs once per shard, the report of the run with the highest peak is kept
+        _, traced_peak = tracemalloc.get_traced_memory()
+        if traced_peak <= self.memory_reports.get(name, (0, None))[0]:
+            return
+        statistics = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_TOP]
+        self.memory_reports[name] = (traced_peak, statistics)
+
+    def start_profiling(self, directory: str):
+        """
+        Turn on the profile mode: phases are profiled with cProfile and allocations are traced with tracemalloc.
+
+        :param directory: directory for the reports
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.profile_dir = directory
+        tracemalloc.start()
+
+    def save_profiles(self):
+        """
+        Write the reports of the profile mode: <phase>.prof files for pstats or snakeviz, <phase>.txt with the functions
+        with the largest cumulative time and <phase>-memory.txt with the peak traced memory of the phase
+        and the places that allocated the most memory still alive at its end.
+        """
+        if self.profile_dir is None:
+            return
+        for name, profiler in self.profilers.items():
+            profiler.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+            with open(os.path.join(self.profile_dir, f'{name}.txt'), 'w') as file:
+                pstats.Stats(profiler, stream=file).sort_stats('cumulative').print_stats(PROFILE_TOP)
+        for name, (traced_peak, statistics) in self.memory_reports.items():
+            with open(os.path.join(self.profile_dir, f'{name}-memory.txt'), 'w') as file:
+                file.write(f"Peak traced memory: {traced_peak / 2 ** 20:.1f} MiB\n")
+                file.write(f"Top {PROFILE_TOP} allocation sites alive at the end of the phase:\n")
+                for statistic in statistics:
+                    file.write(f"{statistic}\n")
+        tracemalloc.stop()
+
+    def merge(self, metrics: dict):
+        """
+        Add the metrics of a worker process to these metrics. Times of workers add up,
+        so with several workers a phase can take longer than the whole run.
+
+        :param metrics: result of to_dict of the worker's metrics
+        """
+        for name, seconds in metrics['timers'].items():
+            self.add_time(name, seconds)
+        for name, value in metrics['counters'].items():
+            self.count(name, value)
+        self.worker_peak_memory = max(self.worker_peak_memory, metrics['peak_memory'])
+
+    def to_dict(self) -> dict:
+        """
+        :return: dict with the timers in seconds, the counters and the peak memory in bytes of this process
+                 or any of the merged worker processes
+        """
+        return {
+            'timers': dict(self.timers),
+            'counters': dict(self.counters),
+            'peak_memory': max(peak_memory(), self.worker_peak_memory)
+        }
+
+    def save(self, path: str, **extra):
+        """
+        Write the metrics to a JSON file.
+
+        :param path: path of the JSON file
+        :param extra: other values to write, e.g. the arguments of the run
+        """
+        with open(path, 'w') as file:
+            json.dump(dict(extra, **self.to_dict()), file, indent=2, default=str)
+
+
+"""Metrics of the current process, shared by all modules"""
+METRICS = Metrics()
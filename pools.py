@@ -0,0 +1,202 @@
+from datetime import date
+from dateutil.relativedelta import relativedelta
+from importlib.metadata import version
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+
+"""Directory of the cached pools, can be changed with the FAKE_DATASET_POOL_DIR environment variable"""
+POOL_DIR = os.environ.get('FAKE_DATASET_POOL_DIR',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'fake_dataset_generation', 'pools'))
+"""Number of values generated by Faker for every pool"""
+POOL_SIZES = {'address': 50_000, 'job': 10_000, 'birth_date': 100_000}
+"""Pools are generated with a fixed seed, so the same Faker version always builds the same pools"""
+POOL_SEED = 0
+"""Increase when the format or the content of the pools changes, so that old caches are rebuilt"""
+POOL_VERSION = 1
+MIN_AGE = 20
+MAX_AGE = 67
+
+
+def birth_date_range(today: date = None) -> tuple:
+    """
+    Range of Faker().date_of_birth(minimum_age=MIN_AGE, maximum_age=MAX_AGE): the dates after the first one
+    up to the last one.
+
+    :param today: the date the ages are counted from, by default today
+    :return: tuple: (first date, number of days in the range)
+    """
+    today = today or date.today()
+    oldest = today - relativedelta(years=MAX_AGE + 1)
+    youngest = today - relativedelta(years=MIN_AGE)
+    return oldest, (youngest - oldest).days
+
+
+class StringTable:
+    """
+    A compact table of strings: UTF-8 bytes of all strings in one array and the offsets where every string starts.
+    Both arrays are .npy files that are memory-mapped, so only the strings that are used are read from disk.
+    """
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        """
+        :param data: uint8 array with the bytes of all strings
+        :param offsets: int64 array with len(strings) + 1 offsets into data
+        """
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings: list) -> 'StringTable':
+        """
+        :param strings: list of strings
+        :return: StringTable with the strings
+        """
+        encoded = [string.encode('utf-8') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    @classmethod
+    def load(cls, path: str) -> 'StringTable':
+        """
+        :param path: path of the table without the -data.npy and -offsets.npy suffixes
+        :return: StringTable with memory-mapped arrays
+        """
+        return cls(np.load(path + '-data.npy', mmap_mode='r'), np.load(path + '-offsets.npy', mmap_mode='r'))
+
+    def save(self, path: str):
+        """
+        :param path: path of the table without the -data.npy and -offsets.npy suffixes
+        """
+        np.save(path + '-data.npy', self.data)
+        np.save(path + '-offsets.npy', self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.data[self.offsets[index]:self.offsets[index + 1]].tobytes().decode('utf-8')
+
+    def take(self, indices: np.ndarray) -> np.ndarray:
+        """
+        :param indices: positions of the strings
+        :return: np.ndarray: object array with the strings
+        """
+        return np.array([self[index] for index in indices], dtype=object)
+
+
+class AttributePools:
+    """
+    Pools of values generated by Faker once and cached on disk: addresses, job titles and birth dates.
+    Birth dates are kept as numbers of days after the first date of birth_date_range, so they stay valid
+    when the date of the run changes. Customers get random values from the pools instead of calling Faker.
+    """
+    def __init__(self, address: StringTable, job: StringTable, birth_date: np.ndarray):
+        self.address = address
+        self.job = job
+        self.birth_date = birth_date
+
+    def addresses(self, size: int) -> np.ndarray:
+        """
+        :param size: number of addresses
+        :return: np.ndarray: random addresses from the pool
+        """
+        return self.address.take(np.random.randint(0, len(self.address), size))
+
+    def jobs(self, size: int) -> np.ndarray:
+        """
+        :param size: number of job titles
+        :return: np.ndarray: random job titles from the pool
+        """
+        return self.job.take(np.random.randint(0, len(self.job), size))
+
+    def birth_dates(self, size: int) -> np.ndarray:
+        """
+        :param size: number of dates of birth
+        :return: np.ndarray: random datetime64 dates of birth from the pool, for clients from MIN_AGE to MAX_AGE
+        """
+        oldest, _ = birth_date_range()
+        return np.datetime64(oldest, 'D') + self.birth_date[np.random.randint(0, len(self.birth_date), size)]
+
+    @staticmethod
+    def metadata() -> dict:
+        """
+        :return: dict that describes the pools, the cache is rebuilt when it changes
+        """
+        return {'version': POOL_VERSION, 'faker': version('Faker'), 'sizes': POOL_SIZES, 'seed': POOL_SEED}
+
+    @classmethod
+    def build(cls, directory: str):
+        """
+        Generate the pools with Faker and save them to the directory. Faker is imported only here.
+        The pools are written to a temporary directory first that is renamed at the end, so other processes
+        never see a half written cache.
+
+        :param directory: directory of the cache
+        """
+        from faker import Faker
+
+        faker = Faker()
+        faker.seed_instance(POOL_SEED)
+        oldest, _ = birth_date_range()
+        address = StringTable.from_strings([faker.address() for _ in range(POOL_SIZES['address'])])
+        job = StringTable.from_strings([faker.job() for _ in range(POOL_SIZES['job'])])
+        birth_date = np.array([(faker.date_of_birth(minimum_age=MIN_AGE, maximum_age=MAX_AGE) - oldest).days
+                               for _ in range(POOL_SIZES['birth_date'])], dtype=np.int32)
+
+        parent = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parent, exist_ok=True)
+        temporary = tempfile.mkdtemp(prefix='pools-', dir=parent)
+        address.save(os.path.join(temporary, 'address'))
+        job.save(os.path.join(temporary, 'job'))
+        np.save(os.path.join(temporary, 'birth_date.npy'), birth_date)
+        with open(os.path.join(temporary, 'metadata.json'), 'w') as file:
+            json.dump(cls.metadata(), file)
+
+        shutil.rmtree(directory, ignore_errors=True)
+        try:
+            os.rename(temporary, directory)
+        except OSError:
+            # Another process has just built the same pools
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    @classmethod
+    def is_fresh(cls, directory: str) -> bool:
+        """
+        :param directory: directory of the cache
+        :return: bool: True if the cache exists and was built with the current Faker version and settings
+        """
+        try:
+            with open(os.path.join(directory, 'metadata.json')) as file:
+                return json.load(file) == cls.metadata()
+        except (OSError, ValueError):
+            return False
+
+    @classmethod
+    def load(cls, directory: str = POOL_DIR) -> 'AttributePools':
+        """
+        Memory-map the cached pools, they are built first if the cache is missing or stale.
+
+        :param directory: directory of the cache
+        :return: AttributePools
+        """
+        if not cls.is_fresh(directory):
+            cls.build(directory)
+        return cls(StringTable.load(os.path.join(directory, 'address')),
+                   StringTable.load(os.path.join(directory, 'job')),
+                   np.load(os.path.join(directory, 'birth_date.npy'), mmap_mode='r'))
+
+
+_POOLS = None
+
+
+def get_pools() -> AttributePools:
+    """
+    :return: AttributePools: pools shared by all customers of the process, loaded on the first call
+    """
+    global _POOLS
+    if _POOLS is None:
+        _POOLS = AttributePools.load()
+    return _POOLS
@@ -0,0 +1,124 @@
+from customer import (EDUCATION_LEVELS, EMPLOYMENT_STATUSES, GENDERS, MARITAL_STATUSES, MONEY_COLUMNS,
+                      RESIDENTIAL_STATUS)
+from datetime import date
+from loan import PURPOSES
+import numpy as np
+import pandas as pd
+
+"""
+Types of the columns of all tables: a list of categories for categorical columns, 'date' for dates,
+'Int32' for integers that can be missing, otherwise a NumPy dtype. Money is kept in float64,
+float32 can not hold cents of amounts above ~100 000.
+"""
+COLUMN_TYPES = {
+    'timestamp': 'date', 'date': 'date', 'date_of_birth': 'date',
+    'customer_id': object, 'loan_id': object, 'geography': object, 'occupation': object,
+    'gender': GENDERS, 'marital_status': MARITAL_STATUSES, 'education_level': EDUCATION_LEVELS,
+    'employment_status': EMPLOYMENT_STATUSES, 'residential_status': RESIDENTIAL_STATUS, 'loan_type': PURPOSES,
+    'citizenship': bool, 'parental_status': bool,
+    'age': np.int32, 'credit_score': np.int32, 'payment_history': np.int32, 'month_income': np.int32,
+    'calls_to_branch': np.int32, 'visits_to_branch': np.int32, 'mobile_entrances': np.int32,
+    'online_entrances': np.int32, 'atm_withdrawals': np.int32, 'atm_deposits': np.int32,
+    'calls_to_support': np.int32, 'adds_use': np.int32, 'customer_feedback': np.int32, 'time_spent': 'Int32',
+    'loan_size': np.int64, 'total_loans_amount': np.int64,
+    'current_balance': np.float64, 'total_current_debt': np.float64, 'loans_repayment': np.float64,
+    'savings': np.float64, 'investment': np.float64, 'monthly_expenses': np.float64
+}
+"""Rows to allocate at first, the buffer grows up to its capacity only if more rows come"""
+INITIAL_ROWS = 1024
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+class RowBuffer:
+    """
+    A class that collects rows of a table in preallocated typed NumPy arrays, one array per column.
+
+    Categorical columns are kept as codes, dates as day numbers and integers that can be missing as values
+    with a mask. to_frame builds a DataFrame on top of the arrays without copying them, except dates
+    that pandas keeps in nanoseconds.
+    """
+    def __init__(self, columns: list, capacity: int):
+        """
+        :param columns: names of the columns, in the order of the values of every row
+        :param capacity: maximum number of rows kept in the buffer
+        """
+        self.columns = columns
+        self.capacity = capacity
+        self.num_rows = 0
+        size = min(capacity, INITIAL_ROWS)
+        self.arrays = []
+        self.masks = {}
+        self.converters = []
+        for i, column in enumerate(columns):
+            column_type = COLUMN_TYPES.get(column, object)
+            if isinstance(column_type, list):
+                self.arrays.append(np.zeros(size, dtype=np.int8))
+                self.converters.append({category: code for code, category in enumerate(column_type)}.__getitem__)
+            elif column_type == 'date':
+                self.arrays.append(np.zeros(size, dtype=np.int32))
+                self.converters.append(date.toordinal)
+            elif column_type == 'Int32':
+                self.arrays.append(np.zeros(size, dtype=np.int32))
+                self.masks[i] = np.zeros(size, dtype=bool)
+                self.converters.append(None)
+            else:
+                self.arrays.append(np.zeros(size, dtype=column_type) if column_type is not object
+                                   else np.empty(size, dtype=object))
+                self.converters.append(None)
+
+    def append(self, values: tuple):
+        """
+        Add one row to the buffer.
+
+        :param values: values of the row, in the order of the columns
+        """
+        n = self.num_rows
+        if n == len(self.arrays[0]):
+            self._grow()
+        for i, (array, convert, value) in enumerate(zip(self.arrays, self.converters, values)):
+            if i in self.masks:
+                self.masks[i][n] = value is None
+                array[n] = 0 if value is None else value
+            else:
+                array[n] = value if convert is None else convert(value)
+        self.num_rows = n + 1
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Build a DataFrame with the rows of the buffer, it shares memory with the buffer until clear is called.
+
+        :return: pd.DataFrame with the typed columns
+        """
+        n = self.num_rows
+        columns = {}
+        for i, (column, array) in enumerate(zip(self.columns, self.arrays)):
+            values = array[:n]
+            column_type = COLUMN_TYPES.get(column, object)
+            if isinstance(column_type, list):
+                columns[column] = pd.Categorical.from_codes(values, column_type)
+            elif column_type == 'date':
+                columns[column] = (values - EPOCH_ORDINAL).astype('datetime64[D]')
+            elif column_type == 'Int32':
+                columns[column] = pd.arrays.IntegerArray(values, self.masks[i][:n])
+            else:
+                if column in MONEY_COLUMNS:
+                    np.round(values, 2, out=values)
+                columns[column] = values
+        return pd.DataFrame(columns, copy=False)
+
+    def clear(self):
+        """
+        Remove all rows from the buffer, the arrays are reused for the next rows.
+        """
+        self.num_rows = 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def _grow(self):
+        size = min(2 * len(self.arrays[0]), self.capacity)
+        if size <= self.num_rows:
+            raise OverflowError("The buffer is full")
+        self.arrays = [np.concatenate([array, np.zeros(size - len(array), dtype=array.dtype)]) for array in self.arrays]
+        self.masks = {i: np.concatenate([mask, np.zeros(size - len(mask), dtype=bool)])
+                      for i, mask in self.masks.items()}
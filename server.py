@@ -0,0 +1,214 @@
+from customer import PAST_DATE, ROW_COLUMNS
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
+from loan import LOAN_COLUMNS
+from pools import get_pools
+from shards import RowList, simulate_customer
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import numpy as np
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+"""Path of the stream, every other path gets 404"""
+STREAM_PATH = '/stream'
+"""Tables a consumer can ask for with the tables parameter"""
+STREAM_TABLES = ['per_client_per_day', 'loans_table']
+"""Longest request line or header accepted from a consumer"""
+MAX_HEADER_BYTES = 8192
+"""Latest end_date of a stream: a customer is simulated on the event loop at once and all its rows are kept
+until they are sent, so a later date would block the other streams and grow the memory of the server"""
+MAX_END_DATE = PAST_DATE + relativedelta(years=5)
+
+
+def to_json(value):
+    """
+    Convert the values of rows that json does not know: dates and NumPy scalars of Customer attributes.
+
+    :param value: value of a row
+    :return: value that json can serialize
+    """
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def encode_row(table: str, row: dict) -> bytes:
+    """
+    :param table: name of the table of the row
+    :param row: the row, e.g. the result of Customer.create_ds_row
+    :return: bytes: one NDJSON line with the table name and the values of the row
+    """
+    return json.dumps(dict(table=table, **row), default=to_json).encode() + b'\n'
+
+
+class DiscardedRows(list):
+    """
+    A writer for the tables that a consumer did not ask for, it keeps no rows.
+    """
+    def write_row(self, values: tuple):
+        pass
+
+
+def encode_customer(index: int, master_seed: int, end_date: date, tables: list) -> bytes:
+    """
+    Simulate one customer of the indexed engine and encode its rows, the loans issued on a day come
+    before the row of that day. Rows of the tables that are not streamed are not built.
+
+    :param index: position of the customer in the dataset
+    :param master_seed: seed of the stream
+    :param end_date: the last simulated date
+    :param tables: tables to stream, from STREAM_TABLES
+    :return: bytes: NDJSON lines of the customer
+    """
+    rows = RowList(ROW_COLUMNS) if 'per_client_per_day' in tables else DiscardedRows()
+    loans = RowList(LOAN_COLUMNS) if 'loans_table' in tables else DiscardedRows()
+    simulate_customer(index, master_seed, end_date, rows, loans)
+    lines = []
+    next_loan = 0
+    for row in rows:
+        # A row's timestamp is the day after the simulated day
+        while next_loan < len(loans) and loans[next_loan]['date'] < row['timestamp']:
+            lines.append(encode_row('loans_table', loans[next_loan]))
+            next_loan += 1
+        lines.append(encode_row('per_client_per_day', row))
+    # Loans issued on the last day, or all loans if the daily rows are not streamed
+    lines += [encode_row('loans_table', loan) for loan in loans[next_loan:]]
+    return b''.join(lines)
+
+
+def parse_stream_parameters(query: str) -> dict:
+    """
+    Parse the parameters of a stream: seed, start (index of the first customer), count (number of customers,
+    endless if missing), end_date (YYYY-MM-DD, the last simulated date, at most MAX_END_DATE) and tables
+    (comma separated).
+
+    :param query: query string of the request
+    :return: dict with the parameters, a random seed if the consumer did not give one
+    :raise ValueError: if a parameter is not valid
+    """
+    values = {name: items[-1] for name, items in parse_qs(query).items()}
+    seed = values.get('seed')
+    parameters = {
+        'seed': int(seed) if seed is not None else int(np.random.SeedSequence().entropy % 2 ** 63),
+        'start': int(values.get('start', 0)),
+        'count': int(values['count']) if 'count' in values else None,
+        'end_date': (date.fromisoformat(values['end_date']) if 'end_date' in values
+                     else date.today() - timedelta(days=1)),
+        'tables': values.get('tables', ','.join(STREAM_TABLES)).split(',')
+    }
+    if parameters['seed'] < 0 or parameters['start'] < 0 or (parameters['count'] or 0) < 0:
+        raise ValueError("seed, start and count must not be negative")
+    if parameters['end_date'] > MAX_END_DATE:
+        raise ValueError(f"end_date must not be after {MAX_END_DATE.isoformat()}")
+    unknown = set(parameters['tables']) - set(STREAM_TABLES)
+    if unknown:
+        raise ValueError(f"tables must be from {STREAM_TABLES}, not {sorted(unknown)}")
+    return parameters
+
+
+async def stream_customers(writer: asyncio.StreamWriter, parameters: dict):
+    """
+    Write the rows of the customers of a stream one customer after another. The next customer is simulated
+    only when the consumer has read enough of the previous ones for the buffer of the connection to drain,
+    so a slow consumer slows down its stream and the memory of the server does not grow.
+
+    :param writer: the consumer's connection
+    :param parameters: result of parse_stream_parameters
+    """
+    index = parameters['start']
+    stop = index + parameters['count'] if parameters['count'] is not None else None
+    while stop is None or index < stop:
+        # A customer is simulated without awaiting, so streams never interleave their draws
+        # from the shared random generators that are reseeded for every customer
+        writer.write(encode_customer(index, parameters['seed'], parameters['end_date'], parameters['tables']))
+        await writer.drain()
+        # drain returns at once while the buffer is small, this lets the other streams go on
+        await asyncio.sleep(0)
+        index += 1
+
+
+async def write_response(writer: asyncio.StreamWriter, status: str, headers: dict = None, body: bytes = b''):
+    """
+    :param writer: the consumer's connection
+    :param status: status line, e.g. '404 Not Found'
+    :param headers: additional headers
+    :param body: body of the response
+    """
+    lines = [f'HTTP/1.1 {status}', 'Connection: close']
+    lines += [f'{name}: {value}' for name, value in (headers or {}).items()]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+
+
+async def handle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """
+    Serve one HTTP request: GET /stream?seed=...&start=...&count=... streams NDJSON rows, with a line per row
+    that holds the name of its table, until count customers are sent or the consumer disconnects.
+
+    :param reader: the consumer's connection
+    :param writer: the consumer's connection
+    """
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            # Headers are not used
+            pass
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        url = urlsplit(target)
+        if url.path != STREAM_PATH:
+            await write_response(writer, '404 Not Found')
+            return
+        if method != 'GET':
+            await write_response(writer, '405 Method Not Allowed', {'Allow': 'GET'})
+            return
+        try:
+            parameters = parse_stream_parameters(url.query)
+        except ValueError as error:
+            await write_response(writer, '400 Bad Request', {'Content-Type': 'text/plain'}, str(error).encode())
+            return
+        await write_response(writer, '200 OK', {'Content-Type': 'application/x-ndjson',
+                                                'X-Seed': parameters['seed']})
+        await stream_customers(writer, parameters)
+    except ValueError:
+        # The request line is not an HTTP request or it is too long
+        await write_response(writer, '400 Bad Request')
+    except ConnectionError:
+        # The consumer has gone away, its stream ends
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+    """
+    Serve streams until the process is stopped.
+
+    :param host: address to listen on
+    :param port: port to listen on
+    """
+    # The attribute pools are loaded or built before the first consumer comes
+    get_pools()
+    server = await asyncio.start_server(handle_connection, host, port, limit=MAX_HEADER_BYTES)
+    print(f"Streaming on http://{host}:{port}{STREAM_PATH}")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream rows of simulated clients as NDJSON over HTTP.')
+    parser.add_argument("--host", default=DEFAULT_HOST, help='Address to listen on.')
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help='Port to listen on.')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from contextlib import contextmanager
+from customer import CUSTOMER_COLUMNS, ROW_COLUMNS, Customer, create_row
+from itertools import accumulate
+from loan import LOAN_COLUMNS
+from metrics import METRICS
+from pools import get_pools
+from stats import STATS
+from simulation import VectorizedSimulation, simulate_customers, simulate_population
+from writers import DEFAULT_CHUNK_ROWS, DatasetWriter, create_sqlite_indexes, merge_databases, prepare_parquet_tables
+from operator import attrgetter
+from tqdm import tqdm
+import numpy as np
+import json
+import os
+import random
+import shutil
+import tempfile
+
+DEFAULT_SHARD_SIZE = 10_000
+DEFAULT_CHECKPOINT_EVERY = 30
+RUN_CONFIG_FILE = 'run.json'
+"""Values of a row of the customers table of a Customer object"""
+_CUSTOMER_VALUES = attrgetter(*CUSTOMER_COLUMNS)
+
+
+def shard_seed(master_seed: int, shard_index: int) -> int:
+    """
+    Derive the seed of a shard from the master seed, the same shard always gets the same seed.
+
+    :param master_seed: seed of the whole run
+    :param shard_index: position of the shard in the run
+    :return: int: seed for random and np.random
+    """
+    return int(np.random.SeedSequence([master_seed, shard_index]).generate_state(1)[0])
+
+
+def seed_all(seed: int):
+    """
+    Seed every random generator used to generate the dataset: random and np.random.
+
+    :param seed: the seed
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def customer_seed(master_seed: int, index: int) -> int:
+    """
+    Derive the seed of a single customer from the master seed, the same customer always gets the same seed.
+    Seeds of customers are spawned from the master seed, so they never match the seeds of shards.
+
+    :param master_seed: seed of the whole run
+    :param index: position of the customer in the dataset
+    :return: int: seed for random and np.random
+    """
+    return int(np.random.SeedSequence(master_seed, spawn_key=(index,)).generate_state(1)[0])
+
+
+@contextmanager
+def preserved_random_state():
+    """
+    Restore the state of random and np.random at the end of the with block, so the functions that regenerate
+    single customers do not change the random draws of their caller, e.g. of a test.
+    """
+    np_random_state, random_state = np.random.get_state(), random.getstate()
+    try:
+        yield
+    finally:
+        np.random.set_state(np_random_state)
+        random.setstate(random_state)
+
+
+def generate_customer(index: int, master_seed: int) -> Customer:
+    """
+    Generate one customer of the dataset of the indexed engine without generating the customers before it.
+    All random draws for the customer, its loans and its simulation come from the customer's own seed,
+    so this is the customer at the given index in any run with the same master seed.
+    The random generators of the caller are left as they were.
+
+    :param index: position of the customer in the dataset
+    :param master_seed: seed of the whole run
+    :return: Customer: the customer on its creation date, before its loans are generated
+    """
+    with preserved_random_state():
+        return _generate_customer(index, master_seed)
+
+
+def _generate_customer(index: int, master_seed: int) -> Customer:
+    # The indexed engine simulates the customer right after this from the same seed, so the state is not restored
+    seed_all(customer_seed(master_seed, index))
+    return Customer()
+
+
+def generate_customers(first_index: int, num_customers: int, master_seed: int, customers_table=None):
+    """
+    Generate the customers of a range of indices one by one, every one from its own seed. A customer is generated
+    only when the next one is requested, so the caller generates its loans and simulates it from its seed.
+
+    :param first_index: position of the first customer in the dataset
+    :param num_customers: number of customers
+    :param master_seed: seed of the whole run
+    :param customers_table: writer of the customers table or None
+    :return: generator of Customer objects
+    """
+    for index in range(first_index, first_index + num_customers):
+        customer = _generate_customer(index, master_seed)
+        if customers_table is not None:
+            customers_table.write_row(_CUSTOMER_VALUES(customer))
+        yield customer
+
+
+class RowList(list):
+    """
+    A writer that keeps the rows as dicts in a list, for the few rows of a single customer.
+    """
+    def __init__(self, columns: list):
+        super().__init__()
+        self.columns = columns
+
+    def write_row(self, values: tuple):
+        self.append(create_row(self.columns, values))
+
+
+def customer_days(index: int, master_seed: int, end_date: date = None, loans: list = None) -> list:
+    """
+    Regenerate the daily rows of one customer of the dataset of the indexed engine, without generating
+    the customers before it. The rows are the same as in the per_client_per_day table of the wide output mode:
+    Python values with amounts of money rounded to cents. The random generators of the caller are left as they were.
+
+    :param index: position of the customer in the dataset
+    :param master_seed: seed of the whole run
+    :param end_date: the last simulated date, by default yesterday like in main
+    :param loans: list that gets the rows of the loans issued to the customer, as dicts, before this function returns
+    :return: list of dicts with the columns of Customer.create_ds_row, one per simulated day
+    """
+    end_date = end_date or date.today() - timedelta(days=1)
+    rows = RowList(ROW_COLUMNS)
+    loans_table = RowList(LOAN_COLUMNS)
+    simulate_customer(index, master_seed, end_date, rows, loans_table)
+    if loans is not None:
+        loans.extend(loans_table)
+    return list(rows)
+
+
+def simulate_customer(index: int, master_seed: int, end_date: date, per_client_per_day, loans_table):
+    """
+    Simulate one customer of the dataset of the indexed engine alone, like customer_days, into the given
+    writers, e.g. RowList. The random generators of the caller are left as they were.
+
+    :param index: position of the customer in the dataset
+    :param master_seed: seed of the whole run
+    :param end_date: the last simulated date
+    :param per_client_per_day: writer of the daily rows of the customer
+    :param loans_table: writer of the loans of the customer
+    """
+    with preserved_random_state():
+        simulate_customers([_generate_customer(index, master_seed)], end_date, per_client_per_day, loans_table)
+
+
+def split_into_shards(num_clients: int, shard_size: int) -> list:
+    """
+    Split the range of clients into shards of shard_size clients, the last shard can be smaller.
+
+    :param num_clients: number of clients in the dataset
+    :param shard_size: number of clients in one shard
+    :return: list of shard sizes
+    """
+    if shard_size < 1:
+        raise ValueError("shard_size must be a positive number")
+    return [min(shard_size, num_clients - start) for start in range(0, num_clients, shard_size)]
+
+
+def generate_shard(shard_index: int, num_customers: int, master_seed: int, engine: str, end_date: date,
+                   writer: DatasetWriter, progress: bool = True, checkpoint=None,
+                   checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY, first_index: int = 0):
+    """
+    Generate and simulate the customers of one shard with the shard's own seed,
+    or with the seeds of the customers with the indexed engine.
+
+    :param shard_index: position of the shard in the run
+    :param num_customers: number of customers in the shard
+    :param master_seed: seed of the whole run
+    :param engine: 'python', 'events', 'vectorized' or 'indexed'
+    :param end_date: the last simulated date
+    :param writer: writer of the tables of the dataset
+    :param progress: show a progress bar
+    :param checkpoint: see VectorizedSimulation.run
+    :param checkpoint_every: see VectorizedSimulation.run
+    :param first_index: position of the first customer of the shard in the dataset
+    """
+    if engine == 'indexed':
+        # Customers are created while they are simulated, so their time is a part of the simulation phase
+        with METRICS.phase('simulation'):
+            customers = generate_customers(first_index, num_customers, master_seed, writer.customers)
+            simulate_customers(tqdm(customers, total=num_customers, disable=not progress), end_date,
+                               writer.per_client_per_day, writer.loans_table, writer.delta)
+        METRICS.count('customers', num_customers)
+        with METRICS.phase('write'):
+            writer.flush()
+        return
+
+    seed_all(shard_seed(master_seed, shard_index))
+    with METRICS.phase('customers'):
+        population = Customer.generate_batch(num_customers)
+        writer.write_customers(population.create_ds_frame())
+    METRICS.count('customers', num_customers)
+    with METRICS.phase('simulation'):
+        simulate_population(population, engine, end_date, writer.per_client_per_day, writer.loans_table, progress,
+                            checkpoint, checkpoint_every, writer.delta)
+    # Chunks never span two shards, so the output does not depend on how shards are spread over workers
+    with METRICS.phase('write'):
+        writer.flush()
+
+
+def generate_shard_parts(shard_index: int, num_customers: int, master_seed: int, engine: str, end_date: date,
+                         paths: dict, chunk_rows: int, output_mode: str, snapshot_path: str = None,
+                         checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY, sink: str = 'csv',
+                         first_index: int = 0, progress: bool = False):
+    """
+    Generate one shard into its own files, this function also runs in worker processes.
+
+    If snapshot_path is given, the state of the shard is saved there periodically together with the sizes
+    of its tables. When the snapshot already exists, the tables are truncated back to those sizes
+    and the simulation continues from the saved state up to end_date instead of starting over.
+    """
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        simulation, sizes = VectorizedSimulation.load_state(snapshot_path)
+        DatasetWriter.truncate(paths, sizes, sink)
+        append = True
+    else:
+        simulation = None
+        append = False
+
+    with DatasetWriter(paths, chunk_rows, output_mode, append, sink, shard_index) as writer:
+        def save_checkpoint(state: VectorizedSimulation):
+            state.save_state(snapshot_path, **writer.tell())
+
+        checkpoint = save_checkpoint if snapshot_path is not None else None
+
+        if simulation is not None:
+            with METRICS.phase('simulation'):
+                simulation.run(end_date, writer.per_client_per_day, writer.loans_table, progress,
+                               checkpoint, checkpoint_every, writer.delta)
+        else:
+            generate_shard(shard_index, num_customers, master_seed, engine, end_date, writer, progress,
+                           checkpoint, checkpoint_every, first_index)
+
+
+def generate_shard_parts_in_worker(*arguments) -> tuple:
+    """
+    Run generate_shard_parts in a worker process and collect the metrics and statistics of this shard only.
+
+    :param arguments: arguments of generate_shard_parts
+    :return: tuple: metrics of the shard, see Metrics.to_dict, and DatasetStats of its rows
+    """
+    METRICS.reset()
+    STATS.reset()
+    generate_shard_parts(*arguments)
+    return METRICS.to_dict(), STATS
+
+
+def merge_parts(part_paths: list, path: str):
+    """
+    Concatenate CSV files into one file, keeping only the first header.
+
+    :param part_paths: paths of the CSV files, in the order they are concatenated
+    :param path: path of the result file
+    """
+    header_written = False
+    with open(path, 'wb') as result:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part:
+                header = part.readline()
+                if not header:
+                    continue
+                if not header_written:
+                    result.write(header)
+                    header_written = True
+                shutil.copyfileobj(part, result)
+
+
+def generate_sharded(num_clients: int, master_seed: int, engine: str, end_date: date, paths: dict,
+                     chunk_rows: int, output_mode: str = 'wide', shard_size: int = DEFAULT_SHARD_SIZE,
+                     workers: int = 1, checkpoint_dir: str = None, checkpoint_every: int = DEFAULT_CHECKPOINT_EVERY,
+                     sink: str = 'csv'):
+    """
+    Generate the datasets shard by shard. Every shard is seeded from the master seed and its index,
+    so with the same master seed the output is the same for any number of workers. With the indexed engine
+    every customer is seeded from the master seed and its own index instead, so the output is also the same
+    for any shard size and every customer can be regenerated alone with customer_days.
+
+    With one worker and without checkpoints shards are simulated one after another in this process and written
+    straight to the output files. Otherwise every shard is written to its own files that are concatenated
+    in shard order at the end, shards are simulated in a process pool if there is more than one worker.
+    With the sqlite sink every shard gets its own database and indexes are built after the databases are merged.
+    With the parquet sink every shard writes its own file into every partition of the tables, nothing is merged.
+
+    With checkpoint_dir the files of the shards and their snapshots are kept in that directory,
+    so running again with the same arguments resumes the unfinished shards, and running with a later end_date
+    extends every shard with the new days only.
+
+    :param num_clients: number of clients in the dataset
+    :param master_seed: seed of the whole run
+    :param engine: 'python', 'events', 'vectorized' or 'indexed'
+    :param end_date: the last simulated date
+    :param paths: dict with the path of the file of every table
+    :param chunk_rows: maximum number of rows kept in memory by every writer
+    :param output_mode: one of writers.OUTPUT_MODES
+    :param shard_size: number of clients in one shard
+    :param workers: number of worker processes
+    :param checkpoint_dir: directory for the files and snapshots of the shards, only for the vectorized engine
+    :param checkpoint_every: number of simulated days between two snapshots
+    :param sink: one of writers.SINKS
+    """
+    shards = split_into_shards(num_clients, shard_size)
+    first_indices = [0, *accumulate(shards[:-1])]
+    if checkpoint_dir is not None and engine != 'vectorized':
+        raise ValueError("Checkpoints are supported only by the vectorized engine")
+    if checkpoint_dir is not None and sink == 'parquet':
+        raise ValueError("Checkpoints are not supported by the parquet sink")
+    if sink == 'parquet':
+        prepare_parquet_tables(paths, DatasetWriter.tables(output_mode))
+    # The attribute pools are built here if they are not cached yet, not by every worker at once
+    with METRICS.phase('pools'):
+        get_pools()
+
+    if workers <= 1 and checkpoint_dir is None:
+        with DatasetWriter(paths, chunk_rows, output_mode, sink=sink) as writer:
+            for shard_index, num_customers in enumerate(shards):
+                generate_shard(shard_index, num_customers, master_seed, engine, end_date, writer,
+                               first_index=first_indices[shard_index])
+        if sink == 'sqlite':
+            with METRICS.phase('merge'):
+                create_sqlite_indexes(paths['loans_table'])
+        return
+
+    if checkpoint_dir is None:
+        parts_dir = tempfile.mkdtemp(prefix='shards-', dir=os.path.dirname(os.path.abspath(paths['loans_table'])))
+    else:
+        parts_dir = checkpoint_dir
+        os.makedirs(parts_dir, exist_ok=True)
+    try:
+        tables = DatasetWriter.tables(output_mode)
+        if sink == 'sqlite':
+            parts = [dict.fromkeys(tables, os.path.join(parts_dir, f'dataset-{i:05d}.db')) for i in range(len(shards))]
+        elif sink == 'parquet':
+            # Shards write their own files into the partitions of the tables, there is nothing to merge
+            parts = [paths] * len(shards)
+        else:
+            parts = [{name: os.path.join(parts_dir, f'{name}-{i:05d}.csv') for name in tables}
+                     for i in range(len(shards))]
+        snapshots = [os.path.join(checkpoint_dir, f'state-{i:05d}.pkl') if checkpoint_dir is not None else None
+                     for i in range(len(shards))]
+        arguments = [(shard_index, num_customers, master_seed, engine, end_date, parts[shard_index], chunk_rows,
+                      output_mode, snapshots[shard_index], checkpoint_every, sink, first_indices[shard_index])
+                     for shard_index, num_customers in enumerate(shards)]
+        if workers <= 1:
+            for shard_arguments in tqdm(arguments):
+                generate_shard_parts(*shard_arguments)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(generate_shard_parts_in_worker, *shard_arguments)
+                           for shard_arguments in arguments]
+                # Statistics are merged in shard order, so their rounding does not depend on the workers
+                for future in tqdm(futures):
+                    metrics, stats = future.result()
+                    METRICS.merge(metrics)
+                    STATS.merge(stats)
+        with METRICS.phase('merge'):
+            if sink == 'sqlite':
+                merge_databases([shard_parts['loans_table'] for shard_parts in parts], paths['loans_table'], tables)
+                create_sqlite_indexes(paths['loans_table'])
+            elif sink == 'csv':
+                for name in tables:
+                    merge_parts([shard_parts[name] for shard_parts in parts], paths[name])
+    finally:
+        if checkpoint_dir is None:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def load_run_config(checkpoint_dir: str) -> dict:
+    """
+    Load the arguments of the run saved in the checkpoint directory.
+
+    :param checkpoint_dir: checkpoint directory of the run
+    :return: dict: arguments of the run or None if the directory has no run yet
+    """
+    path = os.path.join(checkpoint_dir, RUN_CONFIG_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        config = json.load(file)
+    config['end_date'] = date.fromisoformat(config['end_date'])
+    config.setdefault('output_mode', 'wide')
+    config.setdefault('sink', 'csv')
+    config.setdefault('database', 'dataset.db')
+    config.setdefault('chunk_rows', DEFAULT_CHUNK_ROWS)
+    return config
+
+
+def save_run_config(checkpoint_dir: str, config: dict):
+    """
+    Save the arguments of the run to the checkpoint directory, so that it can be resumed or extended later.
+
+    :param checkpoint_dir: checkpoint directory of the run
+    :param config: arguments of the run: num_clients, master_seed, engine, output_mode, sink, shard_size, database,
+                   chunk_rows and end_date
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    with open(os.path.join(checkpoint_dir, RUN_CONFIG_FILE), 'w') as file:
+        json.dump(dict(config, end_date=config['end_date'].isoformat()), file, indent=2)
@@ -0,0 +1,588 @@
+from datetime import date, timedelta
+from customer import Customer, Population, PAST_DATE, MINIMUM_WAGE, ROW_COLUMNS, STATE_COLUMNS, split_dates
+from loan import CREDIT_SCORE_THRESHOLD, MAX_DEBT_TO_INCOME_RATIO, LoanBook, LoanPolicy, generate_loans
+from events import ONE_DAY, build_event_queue, calendar_events
+from metrics import METRICS
+from tqdm import tqdm
+from writers import CsvChunkWriter
+from operator import itemgetter
+import numpy as np
+import pandas as pd
+import os
+import pickle
+import random
+import time
+
+EXPENSES_OWNS = np.arange(0.3, 0.5, 0.05)
+EXPENSES_RENT = np.arange(0.4, 0.65, 0.05)
+
+"""Fields of Customer that never change during the simulation"""
+STATIC_FIELDS = ['gender', 'geography', 'marital_status', 'education_level', 'employment_status', 'occupation',
+                 'citizenship', 'residential_status', 'parental_status', 'calls_to_branch', 'visits_to_branch',
+                 'mobile_entrances', 'online_entrances', 'atm_withdrawals', 'atm_deposits', 'calls_to_support',
+                 'adds_use', 'time_spent', 'customer_feedback']
+"""Position of the first value after the age in Customer.create_ds_values, the rest does not change on quiet days"""
+_FIRST_STATIC = ROW_COLUMNS.index('age') + 1
+_STATE_VALUES = itemgetter(*[ROW_COLUMNS.index(column) for column in STATE_COLUMNS])
+
+
+def simulate_day(customer: Customer, loans: list, day: date, loans_table: CsvChunkWriter):
+    """
+    Apply the events of one day to a client: issue the loans scheduled on this day, then pay the salary,
+    deduct expenses, pay loans, add savings or investments, or get their returns depending on the day of month.
+    On all other days the daily loan repayment and expenses are reset.
+
+    :param customer: the client
+    :param loans: candidate loans of the client
+    :param day: the simulated date
+    :param loans_table: writer of the loans dataset
+    """
+    # update age on a current date
+    customer.age = customer.calculate_age(day)
+    for loan in loans:
+        if loan.date == day:
+            if loan.can_take_loan(CREDIT_SCORE_THRESHOLD, MAX_DEBT_TO_INCOME_RATIO):
+                customer.num_current_loans += 1
+                customer.debt_ledger.add(loan.full_dept, loan.loan_size, loan.loan_month_payment)
+                customer.loans_repayment = 0
+                loans_table.write_row(loan.create_ds_values())
+                METRICS.count('loans_issued')
+            else:
+                METRICS.count('loans_rejected')
+
+    # Simulate salary day
+    if day.day == 1:
+        customer.current_balance += customer.month_income
+
+    # day when all expenses deducted
+    elif day.day == 10:
+        if customer.residential_status == 'owns':
+            customer.monthly_expenses = np.random.choice(EXPENSES_OWNS)
+        else:
+            customer.monthly_expenses = np.random.choice(EXPENSES_RENT)
+        customer.current_balance -= max(customer.monthly_expenses * customer.current_balance, MINIMUM_WAGE)
+
+    # Simulate loan payment day
+    elif day.day == 15:
+        # Check if the client can pay loan on current date
+        ledger = customer.debt_ledger
+        for slot in ledger.slots():
+            if round(ledger.debt[slot], 2) > 0:
+                loan_month_payment = ledger.month_payment[slot]
+                if customer.current_balance - loan_month_payment > 0:
+                    customer.loans_repayment += loan_month_payment
+                    ledger.pay(slot, loan_month_payment)
+                    customer.current_balance -= loan_month_payment
+                else:
+                    customer.payment_history += 1
+                    customer.credit_score -= 10
+            else:
+                ledger.close(slot)
+                customer.num_current_loans -= 1
+
+    # Add savings
+    elif day.day == 17:
+        if customer.savings > 0:
+            new_savings = random.randint(500, 2000)
+            if customer.current_balance > new_savings:
+                customer.savings += new_savings
+                customer.current_balance -= new_savings
+
+    # Add investments
+    elif day.day == 19:
+        if customer.investment > 0:
+            new_investments = random.randint(500, 4000)
+            if customer.current_balance > new_investments:
+                customer.investment += new_investments
+                customer.current_balance -= new_investments
+
+    elif day.day == 25:
+        customer.savings += customer.savings * 0.01
+
+    elif day.day == 30:
+        monthly_return = random.uniform(-0.1, 0.1) * customer.investment
+        customer.investment += monthly_return
+
+    else:
+        customer.loans_repayment = 0
+        customer.monthly_expenses = 0
+
+
+def write_day_row(per_client_per_day: CsvChunkWriter, row: tuple, last_state: tuple, delta: bool) -> tuple:
+    """
+    Write a row of the per client per day dataset, in the delta mode only if the client's state changed.
+
+    :param per_client_per_day: writer of the per client per day dataset
+    :param row: the row, result of Customer.create_ds_values
+    :param last_state: state of the client in the last written row
+    :param delta: write the row only if the client's state changed since the last written row
+    :return: tuple: state of the client in the last written row
+    """
+    if not delta:
+        per_client_per_day.write_row(row)
+        return last_state
+    # Amounts are rounded to cents like in the written rows, changes of a fraction of a cent are not written
+    state = tuple(round(value, 2) for value in _STATE_VALUES(row))
+    if state == last_state:
+        return last_state
+    per_client_per_day.write_row(row)
+    return state
+
+
+def simulate_customers(customers, end_date: date, per_client_per_day: CsvChunkWriter, loans_table: CsvChunkWriter,
+                       delta: bool = False):
+    """
+    Simulate clients one by one, day by day, from their creation date up to and including end_date.
+    Rows are passed to the writers as soon as they are created.
+
+    :param customers: iterable of Customer objects
+    :param end_date: the last simulated date
+    :param per_client_per_day: writer of the per client per day dataset
+    :param loans_table: writer of the loans dataset
+    :param delta: write a daily row only if the client's state changed since the last written row
+    """
+    for customer in customers:
+        last_date = customer.timestamp
+        last_state = None
+
+        # Generate N loans for client
+        start = time.perf_counter()
+        loans = generate_loans(customer)
+        METRICS.add_time('loans', time.perf_counter() - start)
+        num_days = 0
+        simulate_time = rows_time = 0.0
+        while last_date < end_date:
+            last_date = customer.timestamp
+            start = time.perf_counter()
+            simulate_day(customer, loans, last_date, loans_table)
+            customer.timestamp = last_date + ONE_DAY
+            simulated = time.perf_counter()
+            last_state = write_day_row(per_client_per_day, customer.create_ds_values(), last_state, delta)
+            rows_time += time.perf_counter() - simulated
+            simulate_time += simulated - start
+            num_days += 1
+        METRICS.add_time('simulate_day', simulate_time)
+        METRICS.add_time('create_rows', rows_time)
+        METRICS.count('customer_days', num_days)
+
+
+def simulate_quiet_days(customer: Customer, first_day: date, last_day: date, per_client_per_day: CsvChunkWriter,
+                        last_state: tuple, delta: bool) -> tuple:
+    """
+    Write the rows of days without events: the daily loan repayment and expenses are reset on the first day,
+    and the row of that day is repeated with a new timestamp and age for the next days.
+
+    :param customer: the client
+    :param first_day: the first quiet date
+    :param last_day: the last quiet date
+    :param per_client_per_day: writer of the per client per day dataset
+    :param last_state: state of the client in the last written row
+    :param delta: write a row only if the client's state changed since the last written row
+    :return: tuple: state of the client in the last written row
+    """
+    customer.loans_repayment = 0
+    customer.monthly_expenses = 0
+    customer.age = customer.calculate_age(first_day)
+    customer.timestamp = first_day + ONE_DAY
+    row = customer.create_ds_values()
+    last_state = write_day_row(per_client_per_day, row, last_state, delta)
+
+    rest = row[_FIRST_STATIC:]
+    day = first_day + ONE_DAY
+    while day <= last_day:
+        age = customer.calculate_age(day)
+        # Nothing but the timestamp changes, so in the delta mode a row is needed only on a birthday
+        if not delta or age != customer.age:
+            customer.age = age
+            row = (day + ONE_DAY, customer.customer_id, age) + rest
+            last_state = write_day_row(per_client_per_day, row, last_state, delta)
+        day += ONE_DAY
+    customer.timestamp = last_day + ONE_DAY
+    return last_state
+
+
+def simulate_customers_events(customers, end_date: date, per_client_per_day: CsvChunkWriter,
+                              loans_table: CsvChunkWriter, delta: bool = False):
+    """
+    Simulate clients one by one, jumping from one event to the next instead of walking through every day.
+
+    Events are the days of month when simulate_day changes the state of a client and the dates of client's loans,
+    rows of the days between them are filled in by simulate_quiet_days. With the same seed the rows are
+    the same as the ones of simulate_customers.
+
+    :param customers: iterable of Customer objects
+    :param end_date: the last simulated date
+    :param per_client_per_day: writer of the per client per day dataset
+    :param loans_table: writer of the loans dataset
+    :param delta: write a daily row only if the client's state changed since the last written row
+    """
+    calendar = calendar_events(PAST_DATE, end_date)
+    for customer in customers:
+        day = customer.timestamp
+        last_state = None
+
+        # Generate N loans for client
+        start = time.perf_counter()
+        loans = generate_loans(customer)
+        METRICS.add_time('loans', time.perf_counter() - start)
+        METRICS.count('customer_days', max((end_date - day).days + 1, 0))
+        simulate_time = rows_time = 0.0
+        for event_day in build_event_queue(calendar, loans, day, end_date):
+            start = time.perf_counter()
+            if day < event_day:
+                last_state = simulate_quiet_days(customer, day, event_day - ONE_DAY, per_client_per_day,
+                                                 last_state, delta)
+            quiet = time.perf_counter()
+            simulate_day(customer, loans, event_day, loans_table)
+            customer.timestamp = event_day + ONE_DAY
+            simulated = time.perf_counter()
+            last_state = write_day_row(per_client_per_day, customer.create_ds_values(), last_state, delta)
+            rows_time += time.perf_counter() - simulated + quiet - start
+            simulate_time += simulated - quiet
+            day = event_day + ONE_DAY
+        start = time.perf_counter()
+        if day <= end_date:
+            simulate_quiet_days(customer, day, end_date, per_client_per_day, last_state, delta)
+        METRICS.add_time('simulate_day', simulate_time)
+        METRICS.add_time('create_rows', rows_time + time.perf_counter() - start)
+
+
+class VectorizedSimulation:
+    """
+    A simulation engine that keeps the state of all customers in NumPy arrays and advances
+    every customer by one day in a single vectorized step.
+
+    It follows the same daily rules as the per-customer loop in main.main, but the random draws are made
+    for all customers at once, so the output matches the Python engine statistically, not row by row.
+    Rows are produced day by day (all customers for the first day, then for the second one and so on).
+    """
+    def __init__(self, population: Population, loan_book: LoanBook, policy: LoanPolicy = None):
+        """
+        The population and the loan book are not changed, so several simulations, e.g. with different policies,
+        can share them. Their static columns are shared too, only the state that changes day by day is copied.
+
+        :param population: Population with the initial state of all customers
+        :param loan_book: LoanBook with the candidate loans of all customers of the population
+        :param policy: lending policy, by default the one of the Python engine
+        """
+        num_customers = len(population)
+        self.policy = policy or LoanPolicy()
+        if loan_book.interest_rate != self.policy.interest_rate:
+            loan_book = loan_book.with_interest_rate(self.policy.interest_rate)
+        self.start_date = loan_book.start_date
+        self.last_date = self.start_date - timedelta(days=1)
+
+        self.customer_id = population.customer_id
+        self.static = {field: population.columns[field] for field in STATIC_FIELDS}
+        self.birth_year, self.birth_month, self.birth_day = split_dates(population.date_of_birth)
+        self.owns = population.residential_status == 'owns'
+
+        self.current_balance = population.current_balance.astype(np.float64)
+        self.savings = population.savings.astype(np.float64)
+        self.investment = population.investment.astype(np.float64)
+        self.credit_score = population.credit_score.astype(np.int64)
+        self.month_income = population.month_income.astype(np.float64)
+        self.payment_history = np.zeros(num_customers, dtype=np.int64)
+        self.loans_repayment = np.zeros(num_customers, dtype=np.float64)
+        self.monthly_expenses = np.zeros(num_customers, dtype=np.float64)
+
+        # Loans are kept in a (customers x slots) grid, a slot is the position of the loan among customer's loans
+        self.loan_book = loan_book
+        num_loans = np.bincount(loan_book.customer_index, minlength=num_customers)
+        first_loan = np.concatenate([[0], np.cumsum(num_loans)[:-1]])
+        slot = np.arange(len(loan_book)) - first_loan[loan_book.customer_index]
+        max_loans = num_loans.max(initial=0)
+        self.loan_index = np.full((num_customers, max_loans), -1, dtype=np.int64)
+        self.loan_index[loan_book.customer_index, slot] = np.arange(len(loan_book))
+        self.loan_day = np.full((num_customers, max_loans), -1, dtype=np.int64)
+        self.loan_day[loan_book.customer_index, slot] = loan_book.day
+        self.loan_full_dept = np.zeros((num_customers, max_loans), dtype=np.float64)
+        self.loan_full_dept[loan_book.customer_index, slot] = loan_book.full_dept
+        self.loan_size = np.zeros((num_customers, max_loans), dtype=np.int64)
+        self.loan_size[loan_book.customer_index, slot] = loan_book.loan_size
+        self.loan_month_payment = np.zeros((num_customers, max_loans), dtype=np.float64)
+        self.loan_month_payment[loan_book.customer_index, slot] = loan_book.loan_month_payment
+        self.loan_debt = np.zeros((num_customers, max_loans), dtype=np.float64)
+        self.loan_active = np.zeros((num_customers, max_loans), dtype=bool)
+
+        # Like Loan objects, every loan sets the borrowing capacity of its customer when it is created,
+        # so the capacity comes from the last loan of the customer
+        self.borrowing_capacity = np.zeros(num_customers, dtype=np.float64)
+        has_loans = num_loans > 0
+        last_loan = (first_loan + num_loans - 1)[has_loans]
+        self.borrowing_capacity[has_loans] = loan_book.calculate_borrowing_capacity(
+            last_loan, self.month_income[has_loans], np.zeros(len(last_loan)), self.policy.debt_to_income_ratio)
+
+        self.loans_table = None
+        # Last written state of every customer, only used when rows are written on changes
+        self.last_state = np.full((num_customers, len(STATE_COLUMNS)), np.nan)
+
+    def total_current_debt(self, rows=slice(None)) -> np.ndarray:
+        """
+        :param rows: slice or array of indices of customers, by default all customers
+        :return: np.ndarray: the sum of the remaining debt of all active loans of every customer
+        """
+        return np.where(self.loan_active[rows], self.loan_debt[rows], 0).sum(axis=1)
+
+    def total_loans_amount(self, rows: slice = slice(None)) -> np.ndarray:
+        """
+        :param rows: slice of customers, by default all customers
+        :return: np.ndarray: the sum of the sizes of all active loans of every customer
+        """
+        return np.where(self.loan_active[rows], self.loan_size[rows], 0).sum(axis=1)
+
+    def issue_loans(self, day_offset: int):
+        """
+        Issue the loans that are scheduled on the current day to the customers who can take them.
+        Loans of one customer are checked one after another, as the debt of the first issued loan
+        affects the eligibility of the next one.
+
+        :param day_offset: number of days since the start date of the simulation
+        """
+        for j in range(self.loan_day.shape[1]):
+            scheduled = np.flatnonzero(self.loan_day[:, j] == day_offset)
+            if not len(scheduled):
+                continue
+            loans = self.loan_index[scheduled, j]
+            can_take = self.loan_book.can_take_loan(
+                loans, self.credit_score[scheduled], self.month_income[scheduled],
+                self.total_current_debt(scheduled), self.borrowing_capacity[scheduled],
+                self.policy.credit_score_threshold, self.policy.max_debt_to_income_ratio)
+            issued = scheduled[can_take]
+            METRICS.count('loans_issued', len(issued))
+            METRICS.count('loans_rejected', len(scheduled) - len(issued))
+            self.loan_active[issued, j] = True
+            self.loan_debt[issued, j] = self.loan_full_dept[issued, j]
+            self.loans_repayment[issued] = 0
+            if len(issued):
+                self.loans_table.write_frame(self.loan_book.create_ds_frame(loans[can_take]))
+
+    def pay_loans(self):
+        """
+        Pay the month payment of every active loan if the customer has enough money on the balance,
+        otherwise increase the payment history and decrease the credit score. Fully paid loans are closed.
+        """
+        for j in range(self.loan_day.shape[1]):
+            active = self.loan_active[:, j]
+            paid_off = active & (np.round(self.loan_debt[:, j], 2) <= 0)
+            self.loan_active[paid_off, j] = False
+
+            payment = self.loan_month_payment[:, j]
+            in_debt = active & ~paid_off
+            can_pay = in_debt & (self.current_balance - payment > 0)
+            self.loans_repayment[can_pay] += payment[can_pay]
+            self.loan_debt[can_pay, j] -= payment[can_pay]
+            self.current_balance[can_pay] -= payment[can_pay]
+
+            missed = in_debt & ~can_pay
+            self.payment_history[missed] += 1
+            self.credit_score[missed] -= 10
+
+    def step(self, day: date):
+        """
+        Advance every customer by one day.
+
+        :param day: the simulated date
+        """
+        num_customers = len(self.customer_id)
+        self.issue_loans((day - self.start_date).days)
+
+        # Simulate salary day
+        if day.day == 1:
+            self.current_balance += self.month_income
+
+        # day when all expenses deducted
+        elif day.day == 10:
+            self.monthly_expenses = np.where(self.owns,
+                                             np.random.choice(EXPENSES_OWNS, num_customers),
+                                             np.random.choice(EXPENSES_RENT, num_customers))
+            self.current_balance -= np.maximum(self.monthly_expenses * self.current_balance, self.policy.minimum_wage)
+
+        # Simulate loan payment day
+        elif day.day == 15:
+            self.pay_loans()
+
+        # Add savings
+        elif day.day == 17:
+            new_savings = np.random.randint(500, 2001, num_customers)
+            added = (self.savings > 0) & (self.current_balance > new_savings)
+            self.savings[added] += new_savings[added]
+            self.current_balance[added] -= new_savings[added]
+
+        # Add investments
+        elif day.day == 19:
+            new_investments = np.random.randint(500, 4001, num_customers)
+            added = (self.investment > 0) & (self.current_balance > new_investments)
+            self.investment[added] += new_investments[added]
+            self.current_balance[added] -= new_investments[added]
+
+        elif day.day == 25:
+            self.savings += self.savings * 0.01
+
+        elif day.day == 30:
+            self.investment += np.random.uniform(-0.1, 0.1, num_customers) * self.investment
+
+        else:
+            self.loans_repayment[:] = 0
+            self.monthly_expenses = np.zeros(num_customers)
+
+    def create_ds_frame(self, day: date, start: int = 0, stop: int = None,
+                        columns: list = ROW_COLUMNS) -> pd.DataFrame:
+        """
+        Creates a DataFrame with one row per customer for the given day, with the same columns as Customer.create_ds_row.
+
+        :param day: the simulated date
+        :param start: index of the first customer in the frame
+        :param stop: index after the last customer in the frame, by default all customers up to the end
+        :param columns: columns of the frame, a subset of ROW_COLUMNS, e.g. DAILY_COLUMNS if the static columns
+                        are written to the customers table instead
+        :return: pd.DataFrame: rows of the dataset for the given day
+        """
+        rows = slice(start, stop)
+        age = day.year - self.birth_year[rows] - (
+                (day.month < self.birth_month[rows])
+                | ((day.month == self.birth_month[rows]) & (day.day < self.birth_day[rows])))
+        daily = {
+            'timestamp': day + timedelta(days=1),
+            'customer_id': self.customer_id[rows],
+            'age': age,
+            'current_balance': np.round(self.current_balance[rows], 2),
+            'total_current_debt': np.round(self.total_current_debt(rows), 2),
+            'credit_score': self.credit_score[rows],
+            'total_loans_amount': np.round(self.total_loans_amount(rows), 2),
+            'loans_repayment': np.round(self.loans_repayment[rows], 2),
+            'savings': np.round(self.savings[rows], 2),
+            'investment': np.round(self.investment[rows], 2),
+            'month_income': np.round(self.month_income[rows], 2),
+            'monthly_expenses': np.round(self.monthly_expenses[rows] * self.month_income[rows], 2),
+            'payment_history': self.payment_history[rows]
+        }
+        # The static columns are taken from the population only if they are requested
+        return pd.DataFrame({column: daily[column] if column in daily else self.static[column][rows]
+                             for column in columns})
+
+    def create_delta_frame(self, day: date, start: int = 0, stop: int = None,
+                           columns: list = ROW_COLUMNS) -> pd.DataFrame:
+        """
+        Like create_ds_frame, but keeps only the customers whose state changed since their last written row.
+
+        :param day: the simulated date
+        :param start: index of the first customer in the frame
+        :param stop: index after the last customer in the frame, by default all customers up to the end
+        :param columns: columns of the frame, they must include STATE_COLUMNS
+        :return: pd.DataFrame: rows of the dataset for the given day
+        """
+        frame = self.create_ds_frame(day, start, stop, columns)
+        state = frame[STATE_COLUMNS].to_numpy(dtype=np.float64)
+        last_state = self.last_state[start:stop]
+        changed = (state != last_state).any(axis=1)
+        last_state[changed] = state[changed]
+        return frame[changed]
+
+    def run(self, end_date: date, per_client_per_day: CsvChunkWriter, loans_table: CsvChunkWriter,
+            progress: bool = True, checkpoint=None, checkpoint_every: int = 30, delta: bool = False):
+        """
+        Simulate every day after the last simulated date up to and including end_date.
+        The rows of every day are written in frames of at most per_client_per_day.chunk_rows customers,
+        with only the columns of per_client_per_day.
+
+        :param end_date: the last simulated date
+        :param per_client_per_day: writer of the per client per day dataset
+        :param loans_table: writer of the loans dataset
+        :param progress: show a progress bar over the simulated days
+        :param checkpoint: optional function called with the simulation every checkpoint_every days and at the end
+        :param checkpoint_every: number of simulated days between two checkpoints
+        :param delta: write a daily row only if the customer's state changed since the last written row
+        """
+        create_frame = self.create_delta_frame if delta else self.create_ds_frame
+        self.loans_table = loans_table
+        num_customers = len(self.customer_id)
+        first_date = self.last_date + timedelta(days=1)
+        for day_offset in tqdm(range((end_date - first_date).days + 1), disable=not progress):
+            day = first_date + timedelta(days=day_offset)
+            start_time = time.perf_counter()
+            self.step(day)
+            METRICS.add_time('simulate_day', time.perf_counter() - start_time)
+            for start in range(0, num_customers, per_client_per_day.chunk_rows):
+                start_time = time.perf_counter()
+                frame = create_frame(day, start, start + per_client_per_day.chunk_rows,
+                                     per_client_per_day.columns)
+                METRICS.add_time('create_rows', time.perf_counter() - start_time)
+                per_client_per_day.write_frame(frame)
+            METRICS.count('customer_days', num_customers)
+            self.last_date = day
+            if checkpoint is not None and (day_offset + 1) % checkpoint_every == 0:
+                checkpoint(self)
+        if checkpoint is not None:
+            checkpoint(self)
+
+    def save_state(self, path: str, **extra):
+        """
+        Save the state of the simulation and of the random generators to a binary snapshot.
+        The snapshot is written to a temporary file first, so a crash never leaves a broken snapshot behind.
+
+        :param path: path of the snapshot file
+        :param extra: other values to keep in the snapshot, e.g. sizes of the output files
+        """
+        state = {name: value for name, value in self.__dict__.items() if name != 'loans_table'}
+        snapshot = {
+            'simulation': state,
+            'np_random_state': np.random.get_state(),
+            'random_state': random.getstate(),
+            'extra': extra
+        }
+        with open(path + '.tmp', 'wb') as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load_state(cls, path: str) -> tuple:
+        """
+        Load a snapshot saved by save_state and restore the state of the random generators.
+
+        :param path: path of the snapshot file
+        :return: tuple: the restored simulation and the extra values saved with it
+        """
+        with open(path, 'rb') as file:
+            snapshot = pickle.load(file)
+        simulation = cls.__new__(cls)
+        simulation.__dict__.update(snapshot['simulation'])
+        # Snapshots of older versions have no policy, they were simulated with the default one
+        simulation.__dict__.setdefault('policy', LoanPolicy())
+        simulation.loans_table = None
+        np.random.set_state(snapshot['np_random_state'])
+        random.setstate(snapshot['random_state'])
+        return simulation, snapshot['extra']
+
+
+def simulate_population(population: Population, engine: str, end_date: date,
+                        per_client_per_day: CsvChunkWriter, loans_table: CsvChunkWriter, progress: bool = True,
+                        checkpoint=None, checkpoint_every: int = 30, delta: bool = False):
+    """
+    Generate the loans of the population and simulate it with the chosen engine.
+
+    :param population: Population to simulate
+    :param engine: 'python' to simulate customers one by one, 'events' to simulate them one by one jumping between
+                   events or 'vectorized' to simulate all of them at once
+    :param end_date: the last simulated date
+    :param per_client_per_day: writer of the per client per day dataset
+    :param loans_table: writer of the loans dataset
+    :param progress: show a progress bar
+    :param checkpoint: see VectorizedSimulation.run, only the vectorized engine supports checkpoints
+    :param checkpoint_every: see VectorizedSimulation.run
+    :param delta: write a daily row only if the customer's state changed since the last written row
+    """
+    if engine == 'events':
+        customers = (population.customer(i) for i in range(len(population)))
+        simulate_customers_events(tqdm(customers, total=len(population), disable=not progress), end_date,
+                                  per_client_per_day, loans_table, delta)
+    elif engine == 'vectorized':
+        start = time.perf_counter()
+        loan_book = LoanBook.issue(population)
+        METRICS.add_time('loans', time.perf_counter() - start)
+        VectorizedSimulation(population, loan_book).run(
+            end_date, per_client_per_day, loans_table, progress, checkpoint, checkpoint_every, delta)
+    else:
+        customers = (population.customer(i) for i in range(len(population)))
+        simulate_customers(tqdm(customers, total=len(population), disable=not progress), end_date,
+                           per_client_per_day, loans_table, delta)
@@ -0,0 +1,340 @@
+from metrics import METRICS
+import json
+import math
+import numpy as np
+import pandas as pd
+import time
+
+"""Columns summarized with the count, mean, standard deviation, minimum, maximum and quantiles, for every table"""
+NUMERIC_COLUMNS = {
+    'customers': ['month_income'],
+    'per_client_per_day': ['current_balance', 'total_current_debt', 'total_loans_amount', 'loans_repayment',
+                           'savings', 'investment', 'monthly_expenses'],
+    'loans_table': ['loan_size']
+}
+"""Columns summarized with a histogram: column -> edges of the bins, the same for all tables"""
+HISTOGRAM_EDGES = {
+    'credit_score': list(range(300, 851, 50)),
+    'age': list(range(20, 71, 5))
+}
+"""Columns summarized with the number of rows of every value, for every table"""
+COUNT_COLUMNS = {
+    'customers': ['gender', 'employment_status'],
+    'per_client_per_day': ['payment_history'],
+    'loans_table': ['loan_type']
+}
+"""Quantiles of the numeric columns in the report"""
+REPORT_QUANTILES = [0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99]
+"""Relative accuracy of QuantileSketch: a reported quantile is within 1% of a value of the column near that rank"""
+RELATIVE_ACCURACY = 0.01
+"""Values closer to zero than this are counted as zero by QuantileSketch"""
+MIN_INDEXABLE_VALUE = 1e-9
+"""Largest magnitude QuantileSketch tells apart from larger ones"""
+MAX_INDEXABLE_VALUE = 1e15
+
+
+class Moments:
+    """
+    A class that keeps the count, mean, minimum and maximum of a stream of values and the sum of squared
+    differences from the mean (Welford), updated with a whole chunk of values at once and merged with the formulas
+    of Chan et al., so the variance stays accurate for large values and any number of chunks.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+
+    def update(self, values: np.ndarray):
+        """
+        :param values: float64 array of new values
+        """
+        if len(values):
+            mean = values.mean()
+            self._add(len(values), mean, np.square(values - mean).sum(), values.min(), values.max())
+
+    def merge(self, other: 'Moments'):
+        """
+        :param other: Moments of other values, e.g. of another shard
+        """
+        if other.count:
+            self._add(other.count, other.mean, other.m2, other.minimum, other.maximum)
+
+    def _add(self, count: int, mean: float, m2: float, minimum: float, maximum: float):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.minimum = min(self.minimum, float(minimum))
+        self.maximum = max(self.maximum, float(maximum))
+
+    @property
+    def std(self) -> float:
+        """
+        :return: float: sample standard deviation, 0 for less than two values
+        """
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class Histogram:
+    """
+    A class that counts values in bins with fixed edges, so histograms of different shards can be added.
+    The first bin holds the values below the first edge and the last bin the values from the last edge up.
+    """
+    def __init__(self, edges: list):
+        """
+        :param edges: increasing edges of the bins
+        """
+        self.edges = np.asarray(edges, dtype=np.float64)
+        self.counts = np.zeros(len(edges) + 1, dtype=np.int64)
+
+    def update(self, values: np.ndarray):
+        """
+        :param values: float64 array of new values
+        """
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side='right'), minlength=len(self.counts))
+
+    def merge(self, other: 'Histogram'):
+        """
+        :param other: Histogram with the same edges, e.g. of another shard
+        """
+        self.counts += other.counts
+
+    def to_dict(self) -> dict:
+        """
+        :return: dict with the edges and the counts of the bins
+        """
+        return {'edges': self.edges.tolist(), 'counts': self.counts.tolist()}
+
+
+class QuantileSketch:
+    """
+    A class that estimates quantiles of a stream of values in a small, fixed amount of memory (DDSketch).
+
+    The magnitude of every value is mapped to a bucket i with gamma^(i-1) < |value| <= gamma^i, where
+    gamma = (1 + accuracy) / (1 - accuracy), and only the number of values of every bucket is kept, separately
+    for positive and negative values. A quantile is estimated from its bucket with a relative error of at most
+    the accuracy, and sketches are merged by adding the counts of their buckets, so the result does not depend
+    on how the values were split into shards. The buckets cover magnitudes from MIN_INDEXABLE_VALUE
+    to MAX_INDEXABLE_VALUE in two arrays of about 2800 counters, a chunk of values is added with one bincount.
+    """
+    def __init__(self, accuracy: float = RELATIVE_ACCURACY):
+        """
+        :param accuracy: relative accuracy of the quantiles
+        """
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.min_index = math.ceil(math.log(MIN_INDEXABLE_VALUE) / self.log_gamma)
+        num_buckets = math.ceil(math.log(MAX_INDEXABLE_VALUE) / self.log_gamma) - self.min_index + 1
+        self.positive = np.zeros(num_buckets, dtype=np.int64)
+        self.negative = np.zeros(num_buckets, dtype=np.int64)
+        self.zeros = 0
+        self.count = 0
+
+    def update(self, values: np.ndarray):
+        """
+        :param values: float64 array of new values
+        """
+        magnitudes = np.abs(values)
+        indexable = magnitudes > MIN_INDEXABLE_VALUE
+        self.zeros += int(len(values) - np.count_nonzero(indexable))
+        self.count += len(values)
+        for store, selected in [(self.positive, indexable & (values > 0)), (self.negative, indexable & (values < 0))]:
+            if selected.any():
+                # Larger magnitudes than MAX_INDEXABLE_VALUE fall into the last bucket
+                indices = np.ceil(np.log(magnitudes[selected]) / self.log_gamma).astype(np.int64) - self.min_index
+                store += np.bincount(np.minimum(indices, len(store) - 1), minlength=len(store))
+
+    def merge(self, other: 'QuantileSketch'):
+        """
+        :param other: QuantileSketch with the same accuracy, e.g. of another shard
+        """
+        self.positive += other.positive
+        self.negative += other.negative
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """
+        :param q: quantile between 0 and 1
+        :return: float: estimated value of the quantile, None if the sketch is empty
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        # Negative values from the largest magnitude, then zeros, then positive values from the smallest one
+        negative = np.cumsum(self.negative[::-1])
+        if negative[-1] > rank:
+            return -self._value(len(self.negative) - 1 - int(np.searchsorted(negative, rank, side='right')))
+        if negative[-1] + self.zeros > rank:
+            return 0.0
+        positive = negative[-1] + self.zeros + np.cumsum(self.positive)
+        return self._value(min(int(np.searchsorted(positive, rank, side='right')), len(self.positive) - 1))
+
+    def _value(self, bucket: int) -> float:
+        # The point of the bucket with the same relative distance to both of its bounds
+        return 2 * self.gamma ** (bucket + self.min_index) / (self.gamma + 1)
+
+
+class TableStats:
+    """
+    A class that summarizes the rows of one table chunk by chunk, while they are written: the number of rows,
+    Moments and a QuantileSketch of the numeric columns, histograms and the counts of values of other columns.
+    Only the columns present in the chunks are summarized, so the same settings work for every output mode.
+    """
+    def __init__(self, table: str):
+        """
+        :param table: name of the table
+        """
+        self.table = table
+        self.rows = 0
+        self.moments = {}
+        self.sketches = {}
+        self.histograms = {}
+        self.value_counts = {}
+
+    def update(self, frame: pd.DataFrame):
+        """
+        :param frame: a chunk of rows of the table
+        """
+        start = time.perf_counter()
+        self.rows += len(frame)
+        for column in NUMERIC_COLUMNS.get(self.table, []):
+            if column in frame:
+                values = self._values(frame, column)
+                self.moments.setdefault(column, Moments()).update(values)
+                self.sketches.setdefault(column, QuantileSketch()).update(values)
+        for column, edges in HISTOGRAM_EDGES.items():
+            if column in frame:
+                self.histograms.setdefault(column, Histogram(edges)).update(self._values(frame, column))
+        for column in COUNT_COLUMNS.get(self.table, []):
+            if column in frame:
+                counts = self.value_counts.setdefault(column, {})
+                for value, count in zip(*self._value_counts(frame[column])):
+                    value = value.item() if isinstance(value, np.generic) else value
+                    counts[value] = counts.get(value, 0) + int(count)
+        METRICS.add_time('stats', time.perf_counter() - start)
+
+    @staticmethod
+    def _value_counts(series: pd.Series) -> tuple:
+        # Categorical columns of RowBuffer are counted by their codes, columns of the vectorized engine hold values
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            codes, counts = np.unique(series.cat.codes.to_numpy(), return_counts=True)
+            return series.cat.categories[codes], counts
+        return np.unique(series.to_numpy(), return_counts=True)
+
+    @staticmethod
+    def _values(frame: pd.DataFrame, column: str) -> np.ndarray:
+        series = frame[column]
+        if not isinstance(series.dtype, pd.api.extensions.ExtensionDtype):
+            return series.to_numpy(dtype=np.float64)
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        return values[~np.isnan(values)]
+
+    def merge(self, other: 'TableStats'):
+        """
+        :param other: TableStats of the same table, e.g. of another shard
+        """
+        self.rows += other.rows
+        for mine, others, create in [(self.moments, other.moments, Moments),
+                                     (self.sketches, other.sketches, QuantileSketch)]:
+            for column, accumulator in others.items():
+                mine.setdefault(column, create()).merge(accumulator)
+        for column, histogram in other.histograms.items():
+            self.histograms.setdefault(column, Histogram(HISTOGRAM_EDGES[column])).merge(histogram)
+        for column, other_counts in other.value_counts.items():
+            counts = self.value_counts.setdefault(column, {})
+            for value, count in other_counts.items():
+                counts[value] = counts.get(value, 0) + count
+
+    def to_dict(self) -> dict:
+        """
+        :return: dict with the summaries of the columns, numbers rounded for a compact report
+        """
+        report = {'rows': self.rows}
+        if self.moments:
+            report['numeric'] = {}
+            for column, moments in self.moments.items():
+                sketch = self.sketches[column]
+                # Estimates of the extreme quantiles are kept inside the exact range of the values
+                quantiles = {f'p{round(q * 100)}': round(min(max(sketch.quantile(q), moments.minimum),
+                                                                 moments.maximum), 2)
+                             for q in REPORT_QUANTILES if moments.count}
+                report['numeric'][column] = {
+                    'count': moments.count, 'mean': round(moments.mean, 4), 'std': round(moments.std, 4),
+                    'min': moments.minimum if moments.count else None,
+                    'max': moments.maximum if moments.count else None, 'quantiles': quantiles
+                }
+        if self.histograms:
+            report['histograms'] = {column: histogram.to_dict() for column, histogram in self.histograms.items()}
+        if self.value_counts:
+            report['counts'] = {column: {str(value): counts[value] for value in sorted(counts)}
+                                for column, counts in self.value_counts.items()}
+        if 'payment_history' in self.value_counts and self.rows:
+            # payment_history counts all missed payments so far, so this is not the rate of missed payments per day
+            never_missed = self.value_counts['payment_history'].get(0, 0)
+            report['share_with_missed_history'] = round(1 - never_missed / self.rows, 6)
+        return report
+
+
+class DatasetStats:
+    """
+    A class that collects the summary statistics of all tables of a run in one pass, while the rows are written,
+    so the dataset does not have to be read again to check its distributions. Every accumulator can be merged,
+    so every shard collects its own statistics and they are added up at the end like the metrics.
+
+    The statistics describe the written rows: in the delta output mode a daily row is counted only when it is
+    written, and a resumed or extended run summarizes only the rows it wrote itself.
+    """
+    def __init__(self):
+        self.tables = {}
+
+    def reset(self):
+        """
+        Forget all collected statistics, e.g. in a worker process that reports the statistics of one shard.
+        """
+        self.tables = {}
+
+    def table(self, name: str) -> TableStats:
+        """
+        :param name: name of the table
+        :return: TableStats of the table, created on the first call
+        """
+        return self.tables.setdefault(name, TableStats(name))
+
+    def merge(self, other: 'DatasetStats'):
+        """
+        :param other: statistics of a worker process
+        """
+        for name, table_stats in other.tables.items():
+            self.table(name).merge(table_stats)
+
+    def to_dict(self, counters: dict = None) -> dict:
+        """
+        :param counters: counters of the run, see Metrics.counters, for the approval rate of loans
+        :return: dict with the report of every table and the numbers of issued and rejected loans
+        """
+        report = {'tables': {name: self.tables[name].to_dict() for name in sorted(self.tables)}}
+        if counters is not None:
+            issued = counters.get('loans_issued', 0)
+            rejected = counters.get('loans_rejected', 0)
+            report['loans'] = {'issued': issued, 'rejected': rejected,
+                               'approval_rate': round(issued / (issued + rejected), 6) if issued + rejected else None}
+        return report
+
+    def save(self, path: str, counters: dict = None, **extra):
+        """
+        Write the report to a JSON file.
+
+        :param path: path of the JSON file
+        :param counters: counters of the run, see to_dict
+        :param extra: other values to write, e.g. the arguments of the run
+        """
+        with open(path, 'w') as file:
+            json.dump(dict(extra, **self.to_dict(counters)), file, indent=2, default=str)
+
+
+"""Statistics of the current process, filled by the writers of DatasetWriter"""
+STATS = DatasetStats()
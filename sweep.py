@@ -0,0 +1,195 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from customer import Customer
+from loan import LoanBook, LoanPolicy
+from metrics import METRICS
+from pools import get_pools
+from shards import seed_all, shard_seed
+from simulation import VectorizedSimulation
+from stats import STATS
+from writers import DatasetWriter, TABLES, create_sqlite_indexes, prepare_parquet_tables
+from tqdm import tqdm
+import json
+import numpy as np
+import os
+import random
+import re
+import time
+
+"""Scenario names become directory names, so they are limited to these characters and can not be only dots"""
+SCENARIO_NAME = re.compile(r'^(?!\.+$)[A-Za-z0-9_.-]+$')
+"""Summary of a sweep written to its directory: the policy, issued and rejected loans and time of every scenario"""
+SWEEP_FILE = 'sweep.json'
+"""Summary statistics of the dataset of a scenario, written to the directory of the scenario"""
+STATS_FILE = 'stats.json'
+
+"""Population, loan book and random state shared by the scenarios of a process, see share_population"""
+_SHARED = None
+
+
+def load_scenarios(path: str) -> dict:
+    """
+    Load the policies of a sweep from a JSON file with a list of scenarios, every scenario has a name
+    and any of the parameters of LoanPolicy, the missing ones keep their default values, e.g.
+    [{"name": "baseline"}, {"name": "strict", "credit_score_threshold": 700, "interest_rate": 0.07}]
+
+    :param path: path of the JSON file
+    :return: dict: name of every scenario -> LoanPolicy, in the order of the file
+    :raise ValueError: if the file is not a list of objects, or a scenario has no valid name, a duplicate name
+                       or an unknown parameter
+    """
+    with open(path) as file:
+        scenarios = json.load(file)
+    if not isinstance(scenarios, list) or not all(isinstance(scenario, dict) for scenario in scenarios):
+        raise ValueError(f"{path} must contain a JSON list of scenarios, every scenario a JSON object")
+    policies = {}
+    for scenario in scenarios:
+        parameters = dict(scenario)
+        name = str(parameters.pop('name', ''))
+        if not SCENARIO_NAME.match(name):
+            raise ValueError(f"Scenario name {name!r} must consist of letters, digits, '_', '.' and '-' "
+                             "and not only of dots")
+        if name in policies:
+            raise ValueError(f"Scenario {name!r} is defined twice")
+        unknown = set(parameters) - set(LoanPolicy.FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown parameters of scenario {name!r}: {sorted(unknown)}, "
+                             f"the parameters are {LoanPolicy.FIELDS}")
+        policies[name] = LoanPolicy(**parameters)
+    return policies
+
+
+def scenario_paths(directory: str, sink: str) -> dict:
+    """
+    :param directory: output directory of a scenario
+    :param sink: one of writers.SINKS
+    :return: dict with the path of every table inside the directory, like main.py names them
+    """
+    if sink == 'sqlite':
+        return dict.fromkeys(TABLES, os.path.join(directory, 'dataset.db'))
+    if sink == 'parquet':
+        return {name: os.path.join(directory, 'dataset', name) for name in TABLES}
+    return {name: os.path.join(directory, f'{name}.csv') for name in TABLES}
+
+
+def share_population(population, loan_book: LoanBook, random_state: tuple):
+    """
+    Make the population, the candidate loans and the random state after their generation available
+    to run_scenario. It is also the initializer of the worker processes: with the fork start method
+    the workers get the arrays of the parent without copying them, otherwise they are pickled once per worker.
+
+    :param population: Population shared by all scenarios
+    :param loan_book: LoanBook with the candidate loans of the population
+    :param random_state: states of np.random and random after the population and the loans were generated
+    """
+    global _SHARED
+    _SHARED = (population, loan_book, random_state)
+
+
+def run_scenario(name: str, policy: LoanPolicy, end_date: date, directory: str, chunk_rows: int,
+                 output_mode: str, sink: str, progress: bool = False) -> dict:
+    """
+    Simulate the shared population with one policy and write its dataset into the directory of the scenario.
+    Every scenario starts from the same random state, so the scenarios differ only by their policies.
+
+    :param name: name of the scenario
+    :param policy: lending policy of the scenario
+    :param end_date: the last simulated date
+    :param directory: directory of the sweep, the scenario writes into its subdirectory
+    :param chunk_rows: maximum number of rows kept in memory by every writer
+    :param output_mode: one of writers.OUTPUT_MODES
+    :param sink: one of writers.SINKS
+    :param progress: show a progress bar over the simulated days
+    :return: dict with the name, the policy, the issued and rejected loans and the time of the scenario,
+             the summary statistics of its rows are written to STATS_FILE in its directory
+    """
+    population, loan_book, (np_random_state, random_state) = _SHARED
+    np.random.set_state(np_random_state)
+    random.setstate(random_state)
+    start = time.perf_counter()
+    counters = dict(METRICS.counters)
+    STATS.reset()
+    paths = scenario_paths(os.path.join(directory, name), sink)
+    if sink == 'parquet':
+        prepare_parquet_tables(paths, DatasetWriter.tables(output_mode))
+    else:
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+
+    with DatasetWriter(paths, chunk_rows, output_mode, sink=sink) as writer:
+        with METRICS.phase('customers'):
+            writer.write_customers(population.create_ds_frame())
+        with METRICS.phase('simulation'):
+            VectorizedSimulation(population, loan_book, policy).run(
+                end_date, writer.per_client_per_day, writer.loans_table, progress, delta=writer.delta)
+        with METRICS.phase('write'):
+            writer.flush()
+    if sink == 'sqlite':
+        with METRICS.phase('merge'):
+            create_sqlite_indexes(paths['loans_table'])
+    loans = {counter: METRICS.counters.get(counter, 0) - counters.get(counter, 0)
+             for counter in ['loans_issued', 'loans_rejected']}
+    STATS.save(os.path.join(directory, name, STATS_FILE), loans, scenario=name, policy=policy.to_dict())
+    return dict(name=name, policy=policy.to_dict(), seconds=time.perf_counter() - start, **loans)
+
+
+def run_scenario_in_worker(*arguments) -> tuple:
+    """
+    Run run_scenario in a worker process and collect the metrics of this scenario only.
+
+    :param arguments: arguments of run_scenario
+    :return: tuple: result of run_scenario and the metrics of the scenario, see Metrics.to_dict
+    """
+    METRICS.reset()
+    return run_scenario(*arguments), METRICS.to_dict()
+
+
+def run_sweep(policies: dict, num_clients: int, master_seed: int, end_date: date, directory: str,
+              chunk_rows: int, output_mode: str = 'wide', sink: str = 'csv', workers: int = 1) -> list:
+    """
+    Generate one population and its candidate loans, then simulate them with every policy with the vectorized
+    engine. Customers and loans are generated like the first shard of a vectorized run with the same master seed,
+    so a scenario with the default policy gives the dataset of main.py --engine vectorized when all clients fit
+    into one shard. The sweep costs one population and K simulations, the scenarios run in a process pool
+    if there is more than one worker.
+
+    :param policies: dict: name of every scenario -> LoanPolicy, e.g. the result of load_scenarios
+    :param num_clients: number of clients in the population
+    :param master_seed: seed of the whole sweep
+    :param end_date: the last simulated date
+    :param directory: directory of the sweep, every scenario writes its dataset into its own subdirectory
+    :param chunk_rows: maximum number of rows kept in memory by every writer
+    :param output_mode: one of writers.OUTPUT_MODES
+    :param sink: one of writers.SINKS
+    :param workers: number of worker processes
+    :return: list of the results of run_scenario, in the order of the policies
+    """
+    with METRICS.phase('pools'):
+        get_pools()
+    seed_all(shard_seed(master_seed, 0))
+    with METRICS.phase('customers'):
+        population = Customer.generate_batch(num_clients)
+    METRICS.count('customers', num_clients)
+    with METRICS.phase('simulation'):
+        loan_book = LoanBook.issue(population)
+    random_state = (np.random.get_state(), random.getstate())
+
+    os.makedirs(directory, exist_ok=True)
+    arguments = [(name, policy, end_date, directory, chunk_rows, output_mode, sink)
+                 for name, policy in policies.items()]
+    if workers <= 1:
+        share_population(population, loan_book, random_state)
+        results = [run_scenario(*scenario_arguments) for scenario_arguments in tqdm(arguments)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=share_population,
+                                 initargs=(population, loan_book, random_state)) as executor:
+            futures = [executor.submit(run_scenario_in_worker, *scenario_arguments) for scenario_arguments in arguments]
+            results = []
+            for future in tqdm(futures):
+                result, metrics = future.result()
+                METRICS.merge(metrics)
+                results.append(result)
+
+    with open(os.path.join(directory, SWEEP_FILE), 'w') as file:
+        json.dump({'num_clients': num_clients, 'master_seed': master_seed, 'end_date': end_date.isoformat(),
+                   'scenarios': results}, file, indent=2)
+    return results
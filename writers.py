@@ -0,0 +1,605 @@
+from customer import CUSTOMER_COLUMNS, DAILY_COLUMNS, ROW_COLUMNS
+from datetime import date
+from loan import LOAN_COLUMNS
+from metrics import METRICS
+from operator import itemgetter
+from rows import COLUMN_TYPES, RowBuffer
+from stats import STATS
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import sqlite3
+import time
+
+DEFAULT_CHUNK_ROWS = 100_000
+TABLES = ['customers', 'per_client_per_day', 'loans_table']
+"""
+wide - all columns of the client in every row of per_client_per_day.
+normalized - customers table with the columns that never change, per_client_per_day only with the daily columns.
+delta - like normalized, but a row of per_client_per_day is written only on days when the client's state changes.
+"""
+OUTPUT_MODES = ['wide', 'normalized', 'delta']
+"""
+csv - every table to its own CSV file.
+sqlite - all tables to one SQLite database file.
+parquet - every table to a directory of Parquet files partitioned by year and month, needs pyarrow.
+"""
+SINKS = ['csv', 'sqlite', 'parquet']
+"""SQLite types of the columns of all tables, dates are stored as ISO 8601 text"""
+SQLITE_TYPES = {
+    'timestamp': 'TEXT', 'date': 'TEXT', 'date_of_birth': 'TEXT',
+    'customer_id': 'TEXT', 'loan_id': 'TEXT', 'loan_type': 'TEXT',
+    'gender': 'TEXT', 'geography': 'TEXT', 'marital_status': 'TEXT', 'education_level': 'TEXT',
+    'employment_status': 'TEXT', 'occupation': 'TEXT', 'residential_status': 'TEXT',
+    'citizenship': 'INTEGER', 'parental_status': 'INTEGER',
+    'age': 'INTEGER', 'credit_score': 'INTEGER', 'payment_history': 'INTEGER', 'loan_size': 'INTEGER',
+    'calls_to_branch': 'INTEGER', 'visits_to_branch': 'INTEGER', 'mobile_entrances': 'INTEGER',
+    'online_entrances': 'INTEGER', 'atm_withdrawals': 'INTEGER', 'atm_deposits': 'INTEGER',
+    'calls_to_support': 'INTEGER', 'adds_use': 'INTEGER', 'customer_feedback': 'INTEGER',
+    'current_balance': 'REAL', 'total_current_debt': 'REAL', 'total_loans_amount': 'REAL', 'loans_repayment': 'REAL',
+    'savings': 'REAL', 'investment': 'REAL', 'month_income': 'REAL', 'monthly_expenses': 'REAL', 'time_spent': 'INTEGER'
+}
+"""Date columns the Parquet tables are partitioned by, into year_month=YYYY-MM directories"""
+PARTITION_COLUMNS = {'per_client_per_day': 'timestamp', 'loans_table': 'date'}
+"""Name of the Parquet file of a writer in every partition, the part is the index of the shard"""
+PARQUET_FILE = 'part-{:05d}.parquet'
+"""Largest row group of the Parquet files: large enough for fast sequential scans, small enough for readers
+to skip row groups by their statistics. Row groups are never larger than chunk_rows, so chunk_rows still bounds
+the rows a writer keeps in memory"""
+ROW_GROUP_ROWS = 128 * 1024
+"""Columns of the rows passed to write_row of every table"""
+TABLE_COLUMNS = {'customers': CUSTOMER_COLUMNS, 'per_client_per_day': ROW_COLUMNS, 'loans_table': LOAN_COLUMNS}
+"""Indexes of the SQLite database, built once the whole dataset is loaded: name -> (table, columns)"""
+SQLITE_INDEXES = {
+    'customers_customer_id': ('customers', ['customer_id']),
+    'per_client_per_day_customer_id_timestamp': ('per_client_per_day', ['customer_id', 'timestamp']),
+    'loans_table_loan_id': ('loans_table', ['loan_id'])
+}
+
+# Object columns of frames can hold NumPy scalars, dates and missing integers, sqlite3 does not know these types
+for _type in [np.int64, np.int32, np.bool_]:
+    sqlite3.register_adapter(_type, int)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(type(pd.NA), lambda _: None)
+
+
+class ChunkWriter:
+    """
+    A base class of the writers that stream rows of a dataset to a file or a table in chunks.
+
+    Rows are buffered in a RowBuffer, typed NumPy arrays with one array per column, and written in chunks
+    of at most chunk_rows rows, so the memory used by the output does not depend on the number of clients.
+    Subclasses implement _write, that writes one chunk given as a DataFrame. Every chunk is also summarized
+    by stats, if it is set.
+    """
+    def __init__(self, columns: list, chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        """
+        :param columns: names of the columns, in the order of the values of the rows passed to write_row
+        :param chunk_rows: maximum number of rows kept in memory before they are written
+        """
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be a positive number")
+        self.columns = columns
+        self.chunk_rows = chunk_rows
+        self.buffer = RowBuffer(columns, chunk_rows)
+        self.rows_written = 0
+        # TableStats that summarizes every written chunk, set by DatasetWriter
+        self.stats = None
+
+    def write_row(self, values: tuple):
+        """
+        Add one row to the buffer and write the buffer when it is full.
+
+        :param values: row values in the order of the columns, e.g. the result of Customer.create_ds_values
+        """
+        self.buffer.append(values)
+        if len(self.buffer) >= self.chunk_rows:
+            self.flush()
+
+    def write_frame(self, frame: pd.DataFrame):
+        """
+        Write the buffered rows and then the DataFrame, in chunks of at most chunk_rows rows.
+
+        :param frame: rows to write, with the same columns as the rest of the output
+        """
+        self._write_buffer()
+        for start in range(0, len(frame), self.chunk_rows):
+            self._write_chunk(frame.iloc[start:start + self.chunk_rows])
+
+    def flush(self):
+        """
+        Write all buffered rows.
+        """
+        self._write_buffer()
+
+    def close(self):
+        """
+        Write the remaining rows.
+        """
+        self.flush()
+
+    def _write_buffer(self):
+        if len(self.buffer):
+            # The frame shares memory with the buffer, so it must be written before the buffer is reused
+            self._write_chunk(self.buffer.to_frame())
+            self.buffer.clear()
+
+    def _write_chunk(self, frame: pd.DataFrame):
+        if self.stats is not None:
+            self.stats.update(frame)
+        self._write(frame)
+
+    def _write(self, frame: pd.DataFrame):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CsvChunkWriter(ChunkWriter):
+    """
+    A writer that streams rows of a dataset to a CSV file, without the positional index of a DataFrame.
+    """
+    def __init__(self, path: str, columns: list, chunk_rows: int = DEFAULT_CHUNK_ROWS, append: bool = False):
+        """
+        :param path: path of the CSV file
+        :param columns: names of the columns, in the order of the values of the rows passed to write_row
+        :param chunk_rows: maximum number of rows kept in memory before they are written to the file
+        :param append: if True, rows are added to the end of an existing file, without writing the header again
+        """
+        super().__init__(columns, chunk_rows)
+        self.path = path
+        self.file = open(path, 'a' if append else 'w', newline='')
+        self.header_written = self.file.tell() > 0
+
+    def flush(self):
+        """
+        Write all buffered rows to the file.
+        """
+        self._write_buffer()
+        self.file.flush()
+
+    def tell(self) -> int:
+        """
+        Write all buffered rows and return the size of the file, e.g. to truncate it back to this point later.
+
+        :return: int: size of the file in bytes
+        """
+        self.flush()
+        return self.file.tell()
+
+    def close(self):
+        """
+        Write the remaining rows and close the file.
+        """
+        self.flush()
+        self.file.close()
+
+    def _write(self, frame: pd.DataFrame):
+        start = time.perf_counter()
+        frame.to_csv(self.file, header=not self.header_written, index=False)
+        METRICS.add_time('to_csv', time.perf_counter() - start)
+        self.header_written = True
+        self.rows_written += len(frame)
+
+
+class SqliteTableWriter(ChunkWriter):
+    """
+    A writer that streams rows of a dataset to a table of a SQLite database, with the same interface as CsvChunkWriter.
+
+    Rows are inserted with executemany in chunks of at most chunk_rows rows, a transaction is committed
+    once it holds at least chunk_rows rows and on flush. The table is created with the columns of the first written rows and the types from SQLITE_TYPES.
+    """
+    def __init__(self, connection: sqlite3.Connection, table: str, columns: list,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS):
+        """
+        :param connection: connection to the database, shared by the writers of all tables
+        :param table: name of the table
+        :param columns: names of the columns, in the order of the values of the rows passed to write_row
+        :param chunk_rows: maximum number of rows kept in memory before they are inserted into the table
+        """
+        super().__init__(columns, chunk_rows)
+        self.connection = connection
+        self.table = table
+        self.insert = None
+        self.uncommitted_rows = 0
+
+    def flush(self):
+        """
+        Insert all buffered rows into the table and commit the transaction.
+        """
+        self._write_buffer()
+        self._commit()
+
+    def tell(self) -> int:
+        """
+        Insert all buffered rows and return the number of rows in the table, e.g. to truncate it back to this point later.
+
+        :return: int: number of rows in the table
+        """
+        self.flush()
+        if self.insert is None and not table_exists(self.connection, self.table):
+            return 0
+        # Rows are only appended, so the largest rowid is the number of rows
+        return self.connection.execute(f'SELECT coalesce(max(rowid), 0) FROM "{self.table}"').fetchone()[0]
+
+    def close(self):
+        """
+        Insert the remaining rows, the connection is closed by its owner.
+        """
+        self.flush()
+
+    def _commit(self):
+        self.connection.commit()
+        self.uncommitted_rows = 0
+
+    def _write(self, frame: pd.DataFrame):
+        start = time.perf_counter()
+        if self.insert is None:
+            columns = ', '.join(f'"{column}" {SQLITE_TYPES.get(column, "TEXT")}' for column in frame.columns)
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({columns})')
+            self.insert = (f'INSERT INTO "{self.table}" ({", ".join(frame.columns)}) '
+                           f'VALUES ({", ".join("?" * len(frame.columns))})')
+        # Columns are converted to lists of Python values at once, dates are datetime64 columns,
+        # they are stored as text like in the CSV files
+        columns = [values.dt.strftime('%Y-%m-%d').tolist() if pd.api.types.is_datetime64_any_dtype(values.dtype)
+                   else values.tolist() for _, values in frame.items()]
+        self.connection.executemany(self.insert, zip(*columns))
+        self.rows_written += len(frame)
+        self.uncommitted_rows += len(frame)
+        if self.uncommitted_rows >= self.chunk_rows:
+            self._commit()
+        METRICS.add_time('to_sqlite', time.perf_counter() - start)
+
+
+class ParquetTableWriter(ChunkWriter):
+    """
+    A writer that streams rows of a dataset to Parquet files partitioned by year and month of a date column,
+    with the same interface as CsvChunkWriter.
+
+    Every partition is a year_month=YYYY-MM directory with one file of this writer, so readers can skip
+    the months and the columns they do not need. Rows of a partition are collected until they fill a row group
+    of row_group_rows rows. At most chunk_rows rows wait in all partitions together, beyond that the fullest
+    partition is written as a smaller row group, e.g. when every chunk of the python engine spans all months.
+    Categorical columns are dictionary-encoded with the categories from rows.COLUMN_TYPES.
+    pyarrow is imported only when a writer is created, it is needed only by this sink.
+    """
+    def __init__(self, directory: str, columns: list, partition_column: str = None,
+                 chunk_rows: int = DEFAULT_CHUNK_ROWS, part: int = 0, row_group_rows: int = None):
+        """
+        :param directory: directory of the table
+        :param columns: names of the columns, in the order of the values of the rows passed to write_row
+        :param partition_column: date column the files are partitioned by, if None the table is one file
+        :param chunk_rows: maximum number of rows kept in memory before they are converted to Arrow tables
+        :param part: index of the file in every partition, writers of different shards write different files
+        :param row_group_rows: number of rows of a row group, by default ROW_GROUP_ROWS or chunk_rows if it is smaller
+        """
+        import pyarrow as pa
+
+        super().__init__(columns, chunk_rows)
+        self.directory = directory
+        self.partition_column = partition_column
+        self.file_name = PARQUET_FILE.format(part)
+        self.row_group_rows = row_group_rows or min(ROW_GROUP_ROWS, chunk_rows)
+        self.max_pending_rows = max(chunk_rows, self.row_group_rows)
+        self.schema = pa.schema([(column, arrow_type(column)) for column in columns])
+        self.files = {}
+        self.pending = {}
+        self.pending_rows = 0
+
+    def close(self):
+        """
+        Write the remaining rows and the footers of all files.
+        """
+        self._write_buffer()
+        start = time.perf_counter()
+        for partition in list(self.pending):
+            self._write_partition(partition, len(self.pending[partition]))
+        for file in self.files.values():
+            file.close()
+        METRICS.add_time('to_parquet', time.perf_counter() - start)
+
+    def _write_buffer(self):
+        if len(self.buffer):
+            # Arrow tables can share memory with the frame, the rows wait for their row group longer than the buffer
+            self._write_chunk(self.buffer.to_frame().copy())
+            self.buffer.clear()
+
+    def _write(self, frame: pd.DataFrame):
+        import pyarrow as pa
+
+        start = time.perf_counter()
+        # Columns of the vectorized engine hold plain strings, they get the categories of the schema here
+        for column in frame.columns:
+            categories = COLUMN_TYPES.get(column)
+            if isinstance(categories, list) and not isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame = frame.assign(**{column: pd.Categorical(frame[column], categories)})
+        table = pa.Table.from_pandas(frame, schema=self.schema, preserve_index=False)
+        if self.partition_column is None:
+            self._add_rows(None, table)
+        else:
+            months = table.column(self.partition_column).to_numpy().astype('datetime64[M]')
+            for month in np.unique(months):
+                self._add_rows(np.datetime_as_string(month), table.filter(months == month))
+        self.rows_written += len(frame)
+        METRICS.add_time('to_parquet', time.perf_counter() - start)
+
+    def _add_rows(self, partition: str, table):
+        import pyarrow as pa
+
+        pending = self.pending.get(partition)
+        self.pending[partition] = table if pending is None else pa.concat_tables([pending, table])
+        self.pending_rows += len(table)
+        if len(self.pending[partition]) >= self.row_group_rows:
+            num_rows = len(self.pending[partition])
+            self._write_partition(partition, num_rows - num_rows % self.row_group_rows)
+        while self.pending_rows > self.max_pending_rows:
+            fullest = max(self.pending, key=lambda name: len(self.pending[name]))
+            self._write_partition(fullest, len(self.pending[fullest]))
+
+    def _write_partition(self, partition: str, num_rows: int):
+        import pyarrow.parquet as pq
+
+        table = self.pending.pop(partition)
+        if num_rows < len(table):
+            self.pending[partition] = table.slice(num_rows)
+        self.pending_rows -= num_rows
+        file = self.files.get(partition)
+        if file is None:
+            directory = self.directory if partition is None else os.path.join(self.directory, f'year_month={partition}')
+            os.makedirs(directory, exist_ok=True)
+            file = self.files[partition] = pq.ParquetWriter(os.path.join(directory, self.file_name), self.schema)
+        file.write_table(table.slice(0, num_rows), row_group_size=self.row_group_rows)
+
+
+def arrow_type(column: str):
+    """
+    :param column: name of a column
+    :return: pyarrow.DataType of the column in the Parquet files, from rows.COLUMN_TYPES
+    """
+    import pyarrow as pa
+
+    column_type = COLUMN_TYPES.get(column, object)
+    if isinstance(column_type, list):
+        return pa.dictionary(pa.int8(), pa.string())
+    if column_type == 'date':
+        return pa.date32()
+    if column_type == 'Int32':
+        return pa.int32()
+    if column_type is object:
+        return pa.string()
+    return pa.from_numpy_dtype(column_type)
+
+
+def prepare_parquet_tables(paths: dict, tables: list):
+    """
+    Create empty directories of Parquet tables. Directories of all tables of an earlier run are removed first,
+    so that its files do not mix with the new ones.
+
+    :param paths: dict with the directory of every table
+    :param tables: names of the tables written by this run
+    """
+    for path in paths.values():
+        shutil.rmtree(path, ignore_errors=True)
+    for table in tables:
+        os.makedirs(paths[table])
+
+
+def connect_sqlite(path: str, append: bool = False) -> sqlite3.Connection:
+    """
+    Open a SQLite database for bulk loading.
+
+    :param path: path of the database file
+    :param append: if False, an existing database is replaced by an empty one
+    :return: sqlite3.Connection
+    """
+    if not append:
+        # The rollback journal of a crashed run belongs to the old database, it must not be applied to the new one
+        for old_path in [path, path + '-journal']:
+            if os.path.exists(old_path):
+                os.remove(old_path)
+    connection = sqlite3.connect(path)
+    # Tables are loaded in large transactions, a bigger page cache lets them finish without spilling to disk
+    connection.execute('PRAGMA cache_size = -262144')
+    return connection
+
+
+def table_exists(connection: sqlite3.Connection, table: str, schema: str = 'main') -> bool:
+    """
+    :param connection: connection to the database
+    :param table: name of the table
+    :param schema: name of the database, e.g. of an attached one
+    :return: bool: True if the table exists
+    """
+    query = f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?"
+    return connection.execute(query, (table,)).fetchone() is not None
+
+
+def create_sqlite_indexes(path: str):
+    """
+    Build the indexes from SQLITE_INDEXES, after the whole dataset is loaded, so that inserts do not update them.
+
+    :param path: path of the database file
+    """
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            for name, (table, columns) in SQLITE_INDEXES.items():
+                if table_exists(connection, table):
+                    connection.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({", ".join(columns)})')
+    finally:
+        connection.close()
+
+
+def merge_databases(part_paths: list, path: str, tables: list):
+    """
+    Copy the tables of SQLite databases into one new database, in the order of the databases.
+
+    :param part_paths: paths of the databases
+    :param path: path of the result database
+    :param tables: names of the tables to copy
+    """
+    connection = connect_sqlite(path)
+    try:
+        for part_path in part_paths:
+            connection.execute('ATTACH DATABASE ? AS part', (part_path,))
+            with connection:
+                for table in tables:
+                    if not table_exists(connection, table, 'part'):
+                        continue
+                    if not table_exists(connection, table):
+                        schema = connection.execute("SELECT sql FROM part.sqlite_master WHERE type = 'table' "
+                                                    "AND name = ?", (table,)).fetchone()[0]
+                        connection.execute(schema)
+                    connection.execute(f'INSERT INTO main."{table}" SELECT * FROM part."{table}"')
+            connection.execute('DETACH DATABASE part')
+    finally:
+        connection.close()
+
+
+class ColumnsWriter:
+    """
+    A writer that keeps only the given columns of every row and passes them to another writer.
+    """
+    def __init__(self, writer: ChunkWriter, source_columns: list):
+        """
+        :param writer: writer of the kept columns, its columns are the ones that are kept
+        :param source_columns: columns of the rows passed to write_row
+        """
+        self.writer = writer
+        self.columns = writer.columns
+        self.chunk_rows = writer.chunk_rows
+        self.select = itemgetter(*[source_columns.index(column) for column in self.columns])
+
+    def write_row(self, values: tuple):
+        self.writer.write_row(self.select(values))
+
+    def write_frame(self, frame: pd.DataFrame):
+        self.writer.write_frame(frame[self.columns])
+
+    def flush(self):
+        self.writer.flush()
+
+    def tell(self) -> int:
+        return self.writer.tell()
+
+    def close(self):
+        self.writer.close()
+
+
+class DatasetWriter:
+    """
+    A class that holds the writers of all tables of a dataset: customers (only in normalized and delta output modes),
+    per_client_per_day and loans_table.
+    """
+    def __init__(self, paths: dict, chunk_rows: int = DEFAULT_CHUNK_ROWS, output_mode: str = 'wide',
+                 append: bool = False, sink: str = 'csv', part: int = 0):
+        """
+        :param paths: dict with the path of the file of every table, with the sqlite sink it is the same database file,
+                      with the parquet sink the directory of the table
+        :param chunk_rows: maximum number of rows kept in memory by every writer
+        :param output_mode: one of OUTPUT_MODES
+        :param append: if True, rows are added to the end of existing files
+        :param sink: one of SINKS
+        :param part: index of the files of this writer in the Parquet partitions, e.g. the index of the shard
+        """
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"output_mode must be one of {OUTPUT_MODES}")
+        if sink not in SINKS:
+            raise ValueError(f"sink must be one of {SINKS}")
+        self.output_mode = output_mode
+        self.connection = None
+        columns = dict(TABLE_COLUMNS)
+        if output_mode != 'wide':
+            columns['per_client_per_day'] = DAILY_COLUMNS
+        if sink == 'sqlite':
+            self.connection = connect_sqlite(paths['loans_table'], append)
+            self.writers = {name: SqliteTableWriter(self.connection, name, columns[name], chunk_rows)
+                            for name in self.tables(output_mode)}
+        elif sink == 'parquet':
+            self.writers = {name: ParquetTableWriter(paths[name], columns[name], PARTITION_COLUMNS.get(name),
+                                                     chunk_rows, part)
+                            for name in self.tables(output_mode)}
+        else:
+            self.writers = {name: CsvChunkWriter(paths[name], columns[name], chunk_rows, append)
+                            for name in self.tables(output_mode)}
+
+        for name, writer in self.writers.items():
+            writer.stats = STATS.table(name)
+        self.customers = self.writers.get('customers')
+        self.per_client_per_day = self.writers['per_client_per_day']
+        if output_mode != 'wide':
+            self.per_client_per_day = ColumnsWriter(self.per_client_per_day, ROW_COLUMNS)
+        self.loans_table = self.writers['loans_table']
+
+    @staticmethod
+    def tables(output_mode: str) -> list:
+        """
+        :param output_mode: one of OUTPUT_MODES
+        :return: list of names of the tables written in the given output mode
+        """
+        return TABLES[1:] if output_mode == 'wide' else TABLES
+
+    @property
+    def delta(self) -> bool:
+        """
+        :return: bool: True if per_client_per_day rows are written only when the client's state changes
+        """
+        return self.output_mode == 'delta'
+
+    def write_customers(self, frame: pd.DataFrame):
+        """
+        Write rows of the customers table, in the wide output mode these columns are a part of every daily row instead.
+
+        :param frame: rows of the customers table, e.g. the result of Population.create_ds_frame
+        """
+        if self.customers is not None:
+            self.customers.write_frame(frame)
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def tell(self) -> dict:
+        """
+        :return: dict with the size in bytes of the file of every table, or the number of rows with the sqlite sink
+        """
+        return {name: writer.tell() for name, writer in self.writers.items()}
+
+    @staticmethod
+    def truncate(paths: dict, sizes: dict, sink: str = 'csv'):
+        """
+        Truncate the tables back to the sizes returned by tell.
+
+        :param paths: dict with the path of the file of every table
+        :param sizes: dict with the size of every table
+        :param sink: one of SINKS
+        """
+        if sink == 'sqlite':
+            connection = sqlite3.connect(paths['loans_table'])
+            try:
+                with connection:
+                    for name, size in sizes.items():
+                        if table_exists(connection, name):
+                            connection.execute(f'DELETE FROM "{name}" WHERE rowid > ?', (size,))
+            finally:
+                connection.close()
+            return
+        for name, size in sizes.items():
+            os.truncate(paths[name], size)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        if self.connection is not None:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()